@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 from db.models import Base
 
@@ -13,9 +13,29 @@ engine = create_engine(
 # Create a configured "Session" class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Columns added to existing tables after their first release, which create_all
+# won't add to a database that already has the table:
+# (table, column, column type, index to create or None)
+ADDED_COLUMNS = [
+    ("holds", "next_check_at", "DATETIME", "ix_holds_next_check_at"),
+]
+
+def _add_missing_columns():
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table, column, column_type, index in ADDED_COLUMNS:
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            if column in existing:
+                continue
+            print(f"DEBUG: Adding missing column {table}.{column}")
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+            if index:
+                connection.execute(text(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({column})"))
+
 # Function to create all tables in the engine
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
 
 # Dependency to get the database session
 def get_db():
@@ -56,6 +56,46 @@ class Hold(Base):
     queue_position = Column(Integer)
     estimated_wait_days = Column(Integer)
     last_checked = Column(DateTime, default=datetime.utcnow)
+    # When the background refresh should look at this hold again (NULL = as soon as possible).
+    # init_db adds it to databases created before it existed (see ADDED_COLUMNS)
+    next_check_at = Column(DateTime, index=True, nullable=True)
     
     user = relationship("User", back_populates="holds")
 
+
+class HoldJob(Base):
+    __tablename__ = "hold_jobs"
+
+    id = Column(String, primary_key=True, index=True) # UUID handed back to the client
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    
+    # What to place a hold on (credentials are read from the user at run time)
+    title = Column(String, nullable=False)
+    author = Column(String)
+    isbn = Column(String)
+    library_name = Column(String, nullable=False)
+    library_item_id = Column(String, nullable=False)
+    
+    # Job State
+    status = Column(String, default="queued", index=True) # "queued", "running", "succeeded", "failed"
+    progress = Column(String) # Last step reached, e.g. "Placing hold on library website"
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    error = Column(String)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    hold_id = Column(Integer, ForeignKey("holds.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    hold = relationship("Hold")
+
+
+class WorkLease(Base):
+    __tablename__ = "work_leases"
+
+    # What is leased, e.g. "hold-refresh:user:42"
+    key = Column(String, primary_key=True)
+    owner = Column(String, nullable=False, index=True) # NODE_ID of the app replica holding it
+    claim_token = Column(String, nullable=False, index=True) # Identifies the batch claim that took it
+    expires_at = Column(DateTime, nullable=False, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,19 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+import json
 from typing import List, Optional
 from datetime import timedelta
+from contextlib import asynccontextmanager
 
 from db.database import get_db, init_db
 from schemas import schemas
 from services import book_service, library_service, auth_service, admin_service
 from services.nyt_picture_books_service import fetch_nyt_picture_books
+from services.browser_pool import browser_pool
+from services.session_cache import session_cache
+from services.search_cache import search_cache
+from services import resource_blocking, bibliocommons_http
+from services.browser_scheduler import browser_scheduler, SchedulerBusyError
+from services.deadline import ScrapeTimeoutError
+from services import hold_job_service, hold_refresh_service, lease_service
+from services.hold_job_service import hold_job_workers
+from services.hold_refresh_service import hold_refresh_scheduler
+from services.scrape_workers import scrape_workers
+from services.selector_engine import selector_engine
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the shared Chromium instance on startup and shut it down cleanly on exit."""
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        # Don't block startup; the pool relaunches lazily on the first browser request
+        print(f"WARNING: Could not start browser pool: {e}")
+    await scrape_workers.start()
+    await hold_job_workers.start()
+    await hold_refresh_scheduler.start()
+    yield
+    await hold_refresh_scheduler.stop()
+    await hold_job_workers.stop()
+    await scrape_workers.stop()
+    await browser_pool.stop()
+    await bibliocommons_http.close_client()
+    selector_engine.save()
 
 app = FastAPI(
     title="Library Hold Tracker API",
     description="API for tracking library book holds and automating hold placement.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware for React frontend
@@ -25,6 +60,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(SchedulerBusyError)
+async def scheduler_busy_handler(request: Request, exc: SchedulerBusyError):
+    """Browser capacity is exhausted - tell the client when to come back."""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(ScrapeTimeoutError)
+async def scrape_timeout_handler(request: Request, exc: ScrapeTimeoutError):
+    """The library site didn't answer within the request's time budget."""
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": str(exc), "step": exc.step},
+    )
+
 # Initialize the database and create tables
 init_db()
 
@@ -273,16 +325,94 @@ def read_user(user_id: int, db: Session = Depends(get_db)):
 
 # --- Book Search Endpoint ---
 
+def _check_search_bounds(query):
+    if not 1 <= query.limit <= library_service.SEARCH_MAX_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"limit must be between 1 and {library_service.SEARCH_MAX_LIMIT}"
+        )
+    if query.max_pages is not None and not 1 <= query.max_pages <= library_service.SEARCH_MAX_PAGES_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"max_pages must be between 1 and {library_service.SEARCH_MAX_PAGES_LIMIT}"
+        )
+    # Federated searches only; a shared scrape never runs longer than the standard budget anyway
+    timeout_seconds = getattr(query, "timeout_seconds", None)
+    if timeout_seconds is not None and not 0 < timeout_seconds <= library_service.SEARCH_DEADLINE_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"timeout_seconds must be greater than 0 and at most {library_service.SEARCH_DEADLINE_SECONDS:g}"
+        )
+
 @app.post("/books/search", response_model=List[schemas.BookSearchResult])
 async def search_book_endpoint(query: schemas.BookSearchQuery):
     """
     Search a library catalog for a book. This does not require a database connection.
     """
+    _check_search_bounds(query)
     results = await library_service.search_library_catalog(query)
     if not results:
         raise HTTPException(status_code=404, detail="No books found matching your query.")
     return results
 
+def _event_stream(request: Request, events) -> StreamingResponse:
+    """
+    Send search events as Server-Sent Events when the client asks for
+    text/event-stream, otherwise as newline-delimited JSON.
+    """
+    if "text/event-stream" in request.headers.get("accept", ""):
+        async def _sse():
+            async for event in events:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        return StreamingResponse(_sse(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    
+    async def _ndjson():
+        async for event in events:
+            yield json.dumps(event) + "\n"
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+@app.post("/books/search/stream")
+async def search_book_stream_endpoint(query: schemas.BookSearchQuery, request: Request):
+    """
+    Search a library catalog, streaming each result as soon as it's parsed,
+    followed by a summary event. See library_service.search_events.
+    """
+    _check_search_bounds(query)
+    return _event_stream(request, library_service.search_events(query))
+
+def _federated_library_names(query: schemas.FederatedSearchQuery, db: Session) -> List[str]:
+    library_names = query.libraries
+    if not library_names:
+        library_names = [library.name for library in admin_service.get_all_libraries(db, include_inactive=False)]
+    if not library_names:
+        # No libraries configured by an admin yet - use the built-in ones
+        library_names = list(library_service.LIBRARY_URLS)
+    return library_names
+
+@app.post("/books/search/federated", response_model=schemas.FederatedSearchResponse)
+async def federated_search_endpoint(query: schemas.FederatedSearchQuery, db: Session = Depends(get_db)):
+    """
+    Search every active library (or the ones listed in the query) at once.
+    Libraries that time out or fail are reported in `libraries` and the
+    results from the rest are still returned.
+    """
+    _check_search_bounds(query)
+    return await library_service.federated_search(query, _federated_library_names(query, db))
+
+@app.post("/books/search/federated/stream")
+async def federated_search_stream_endpoint(
+    query: schemas.FederatedSearchQuery,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Federated search with streamed results, a status event as each library
+    finishes, and a final summary. See library_service.federated_search_events.
+    """
+    _check_search_bounds(query)
+    library_names = _federated_library_names(query, db)
+    return _event_stream(request, library_service.federated_search_events(query, library_names))
+
 # --- NYT Best Sellers Picture Books Endpoint ---
 
 @app.get("/nyt/picture-books", response_model=List[dict])
@@ -304,14 +434,21 @@ class SimplePlaceHoldRequest(schemas.BaseModel):
     library_item_id: str
     library_name: str = "Contra Costa"
 
-@app.post("/holds/place", response_model=schemas.Hold)
+@app.post(
+    "/holds/place",
+    response_model=schemas.Hold,
+    responses={status.HTTP_202_ACCEPTED: {"model": schemas.HoldJob, "description": "Hold job queued (async_mode=true)"}},
+)
 async def place_hold_endpoint(
     hold_request: SimplePlaceHoldRequest,
+    async_mode: bool = False,
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Place a hold using authenticated user's library credentials
+    Place a hold using authenticated user's library credentials.
+    With async_mode=true the hold is queued and a job is returned right away
+    (202); poll /holds/jobs/{job_id} for progress and the resulting hold.
     """
     # Check if user has library credentials
     if not current_user.library_card_number or not current_user.library_pin:
@@ -320,6 +457,13 @@ async def place_hold_endpoint(
             detail="Library card credentials not set. Please update your library card information first."
         )
     
+    if async_mode:
+        job = hold_job_service.enqueue_hold_job(db, current_user.id, schemas.HoldBase(**hold_request.model_dump()))
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=jsonable_encoder(schemas.HoldJob.model_validate(job)),
+        )
+    
     # Build full hold request with user's credentials
     full_hold_request = schemas.PlaceHoldRequest(
         user_id=current_user.id,
@@ -335,40 +479,140 @@ async def place_hold_endpoint(
     # 1. Attempt to place the hold on the external library website
     try:
         hold_data = await library_service.place_hold(full_hold_request)
+    except (SchedulerBusyError, ScrapeTimeoutError):
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to place hold on library website: {e}"
         )
 
-    # 2. Save the successful hold record to the database
-    hold_create = schemas.HoldCreate(
-        user_id=current_user.id,
-        title=hold_data["title"],
-        author=hold_data.get("author"),
-        isbn=hold_data.get("isbn"),
-        library_name=hold_data["library_name"],
-        library_item_id=hold_data["library_item_id"]
-    )
-    db_hold = book_service.create_hold(db=db, hold=hold_create)
+    # 2. Save the successful hold record to the database, with the status
+    # information from the library
+    return book_service.record_placed_hold(db, current_user.id, hold_data)
+
+@app.post("/holds/place-batch", response_model=schemas.BatchPlaceHoldResponse)
+async def place_holds_batch_endpoint(
+    batch_request: schemas.BatchPlaceHoldRequest,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Place holds on several items with one library login. Each item gets its
+    own result; failures don't stop the rest of the batch.
+    """
+    if not current_user.library_card_number or not current_user.library_pin:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Library card credentials not set. Please update your library card information first."
+        )
+    if not batch_request.items or len(batch_request.items) > 50:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A batch must contain between 1 and 50 items"
+        )
+    
+    try:
+        outcomes = await library_service.place_holds_batch(
+            batch_request.library_name,
+            current_user.library_card_number,
+            current_user.library_pin,
+            batch_request.items,
+        )
+    except (SchedulerBusyError, ScrapeTimeoutError):
+        raise
+    except Exception as e:
+        # Login failed, so no hold in the batch could be placed
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to place holds on library website: {e}"
+        )
     
-    # 3. Update the database record with the status information from the library
-    # Extract only the status fields for the update
-    status_fields = {k: v for k, v in hold_data.items() 
-                    if k in ["status", "queue_position", "estimated_wait_days", "last_checked"]}
-    book_service.update_hold_status(db, db_hold.id, status_fields)
+    # Save every placed hold in one transaction
+    placed = [outcome["hold_data"] for outcome in outcomes if outcome["success"]]
+    saved = iter(book_service.record_placed_holds(db, current_user.id, placed))
     
-    return book_service.update_hold_status(db, db_hold.id, status_fields)
+    results = []
+    for item, outcome in zip(batch_request.items, outcomes):
+        results.append(schemas.BatchHoldResult(
+            title=item.title,
+            library_item_id=item.library_item_id,
+            success=outcome["success"],
+            error=outcome.get("error"),
+            hold=schemas.Hold.model_validate(next(saved)) if outcome["success"] else None,
+        ))
+    return {"placed": len(placed), "failed": len(results) - len(placed), "results": results}
+
+@app.get("/holds/jobs/{job_id}", response_model=schemas.HoldJob)
+def get_hold_job_endpoint(
+    job_id: str,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the progress of an async hold placement job
+    """
+    job = hold_job_service.get_hold_job(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Hold job not found"
+        )
+    return job
 
 @app.get("/holds/my-holds", response_model=List[schemas.Hold])
-def get_my_holds(
+async def get_my_holds(
+    response: Response,
+    max_staleness_seconds: Optional[int] = None,
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get all holds for the authenticated user.
+    If max_staleness_seconds is given and the stored statuses are older than that,
+    the cached rows are returned right away and a refresh is started in the background.
+    """
+    holds = book_service.get_holds_by_user(db, user_id=current_user.id)
+    if max_staleness_seconds is not None and current_user.library_card_number and current_user.library_pin:
+        age = hold_refresh_service.holds_age_seconds(holds)
+        if age is not None and age > max_staleness_seconds:
+            hold_refresh_service.start_user_refresh(current_user.id)
+            response.headers["X-Holds-Refreshing"] = "true"
+    return holds
+
+@app.get("/holds/my-holds/fresh", response_model=schemas.MyHoldsResponse)
+async def get_my_fresh_holds(
+    max_staleness_seconds: int = 300,
+    timeout_seconds: float = 20.0,
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Get all holds for the authenticated user
+    Get the authenticated user's holds, refreshing them first if they're older than
+    max_staleness_seconds. Waits at most timeout_seconds; if the refresh is still running
+    the cached rows come back with is_fresh=false (the refresh keeps going).
     """
-    return book_service.get_holds_by_user(db, user_id=current_user.id)
+    holds = book_service.get_holds_by_user(db, user_id=current_user.id)
+    age = hold_refresh_service.holds_age_seconds(holds)
+    if age is None or age <= max_staleness_seconds:
+        return {"holds": holds, "is_fresh": True, "age_seconds": age}
+
+    if not current_user.library_card_number or not current_user.library_pin:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Library card credentials not set. Please update your library card information first."
+        )
+
+    timeout_seconds = min(max(timeout_seconds, 0.0), hold_refresh_service.HOLD_REFRESH_MAX_WAIT_SECONDS)
+    holds, age, outcome = await hold_refresh_service.wait_for_fresh_holds(
+        db, current_user.id, max_staleness_seconds, timeout_seconds
+    )
+    return {
+        "holds": holds,
+        "is_fresh": age is None or age <= max_staleness_seconds,
+        "age_seconds": age,
+        "refresh_status": outcome,
+    }
 
 @app.get("/holds/{user_id}", response_model=List[schemas.Hold])
 def get_user_holds_endpoint(user_id: int, db: Session = Depends(get_db)):
@@ -380,25 +624,14 @@ def get_user_holds_endpoint(user_id: int, db: Session = Depends(get_db)):
 @app.post("/holds/update_all_status")
 async def update_all_holds_status_endpoint(db: Session = Depends(get_db)):
     """
-    Periodically check the status of all tracked holds and update the database.
-    This would typically be run as a scheduled background task.
+    Check the status of all tracked holds and update the database.
+    Each user's holds are read from their library's 'My Holds' page in one login.
     """
-    all_holds = db.query(models.Hold).all()
-    updated_count = 0
-    
-    for hold in all_holds:
-        # For a real implementation, you'd need the user's credentials to log in,
-        # which would be retrieved securely (e.g., from an encrypted vault) using hold.user_id.
-        # For this example, we'll use the placeholder service which doesn't need credentials.
-        
-        # 1. Check status on the library website
-        status_update = await library_service.check_hold_status(hold)
-        
-        # 2. Update the database record
-        book_service.update_hold_status(db, hold.id, status_update)
-        updated_count += 1
-        
-    return {"message": f"Successfully checked and updated status for {updated_count} holds."}
+    summary = await hold_refresh_service.refresh_leased_holds(db)
+    return {
+        "message": f"Checked {summary['checked']} holds for {summary['users']} users, updated {summary['updated']}.",
+        **summary,
+    }
 
 # --- Admin Endpoints ---
 
@@ -640,3 +873,27 @@ def admin_activate_library(
         )
     return library
 
+
+# --- Admin Metrics ---
+
+@app.get("/admin/metrics")
+def admin_get_metrics(admin_user = Depends(get_admin_user)):
+    """
+    Browser pool and cache statistics (admin only)
+    """
+    return {
+        "browser_pool": browser_pool.stats(),
+        "browser_scheduler": browser_scheduler.stats(),
+        "adaptive_concurrency": browser_scheduler.controller.stats() if browser_scheduler.controller else None,
+        "scrape_workers": scrape_workers.stats(),
+        "session_cache": session_cache.stats(),
+        "search_cache": search_cache.stats(),
+        "resource_blocking": resource_blocking.stats(),
+        "selectors": selector_engine.stats(),
+        "hold_refresh": hold_refresh_scheduler.stats(),
+        "leases": lease_service.stats(),
+        "single_flight": {
+            "search": library_service.search_flight.stats(),
+            "hold_status": library_service.hold_status_flight.stats(),
+        },
+    }
@@ -8,6 +8,8 @@ class BookSearchQuery(BaseModel):
     query: str
     search_type: str # e.g., "title", "author", "isbn"
     library: str # e.g., "Contra Costa", "Alameda"
+    limit: int = 5 # Number of physical books to return
+    max_pages: Optional[int] = None # Result pages to search at most (server default when unset)
 
 class BookSearchResult(BaseModel):
     title: str
@@ -17,6 +19,25 @@ class BookSearchResult(BaseModel):
     library_name: str
     availability: str # e.g., "Available", "On Order", "1 copy, 5 holds"
 
+class FederatedSearchQuery(BaseModel):
+    query: str
+    search_type: str # e.g., "title", "author", "isbn"
+    libraries: Optional[List[str]] = None # Defaults to every active library
+    timeout_seconds: float = 20.0 # Per-library time limit
+    limit: int = 5 # Physical books to return from each library
+    max_pages: Optional[int] = None # Result pages to search at most in each library
+
+class LibrarySearchStatus(BaseModel):
+    library: str
+    status: str # "ok", "timeout", "error" or "unsupported"
+    result_count: int = 0
+    elapsed_ms: int = 0
+    error: Optional[str] = None
+
+class FederatedSearchResponse(BaseModel):
+    results: List[BookSearchResult]
+    libraries: List[LibrarySearchStatus]
+
 # --- User Schemas ---
 
 class UserBase(BaseModel):
@@ -88,6 +109,52 @@ class Hold(HoldBase):
     queue_position: Optional[int] = None
     estimated_wait_days: Optional[int] = None
     last_checked: datetime
+    next_check_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class MyHoldsResponse(BaseModel):
+    holds: List[Hold]
+    is_fresh: bool # False if the refresh didn't finish before the deadline
+    age_seconds: Optional[float] = None # Age of the stalest active hold
+    refresh_status: Optional[str] = None # "finished", "timed_out", "failed" or "leased_elsewhere"; None if no refresh was needed
+
+class BatchHoldItem(BaseModel):
+    title: str
+    author: Optional[str] = None
+    isbn: Optional[str] = None
+    library_item_id: str
+
+class BatchPlaceHoldRequest(BaseModel):
+    library_name: str = "Contra Costa"
+    items: List[BatchHoldItem]
+
+class BatchHoldResult(BaseModel):
+    title: str
+    library_item_id: str
+    success: bool
+    error: Optional[str] = None
+    hold: Optional[Hold] = None
+
+class BatchPlaceHoldResponse(BaseModel):
+    placed: int
+    failed: int
+    results: List[BatchHoldResult]
+
+class HoldJob(BaseModel):
+    id: str
+    status: str # "queued", "running", "succeeded", "failed"
+    progress: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    title: str
+    library_name: str
+    library_item_id: str
+    created_at: datetime
+    updated_at: datetime
+    hold: Optional[Hold] = None # Set once the job has succeeded
 
     class Config:
         from_attributes = True
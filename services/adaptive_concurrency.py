@@ -0,0 +1,156 @@
+"""
+Adaptive per-host concurrency limits (AIMD).
+
+A fixed per-library limit is too low when the catalogs are quiet and too high
+when BiblioCommons is slow. The controller keeps one limit per library host
+and adjusts it from the outcome of every browser job: while jobs finish within
+the latency target and the host has memory to spare, the limit grows
+additively (about +1 per limit's worth of successful jobs); on a timeout, a
+very slow job or memory pressure it is halved. browser_scheduler consults it
+for the per-library cap.
+"""
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, Any
+from urllib.parse import urlparse
+
+from services.browser_pool import browser_pool, BROWSER_MAX_RSS_MB
+
+# --- Configuration ---
+ADAPTIVE_CONCURRENCY_ENABLED = os.getenv("ADAPTIVE_CONCURRENCY_ENABLED", "true").lower() not in ("0", "false", "no")
+AIMD_MIN_LIMIT = 1
+AIMD_MAX_LIMIT = int(os.getenv("AIMD_MAX_LIMIT", "6"))
+AIMD_LATENCY_TARGET_SECONDS = float(os.getenv("AIMD_LATENCY_TARGET_SECONDS", "15"))
+AIMD_DECREASE_FACTOR = 0.5
+# Don't cut again until the jobs started under the old limit have had time to finish
+AIMD_DECREASE_COOLDOWN_SECONDS = 10
+HOST_MIN_AVAILABLE_MB = int(os.getenv("HOST_MIN_AVAILABLE_MB", "500"))
+BROWSER_RSS_PRESSURE_FRACTION = 0.8
+MEMORY_SAMPLE_SECONDS = 5
+HISTORY_KEPT = 50
+
+
+def _host_available_mb() -> Optional[float]:
+    """MemAvailable from /proc/meminfo, None where that doesn't exist."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class _HostLimit:
+    def __init__(self, initial: float):
+        self.limit = initial
+        self.avg_latency: Optional[float] = None
+        self.successes = 0
+        self.decreases = 0
+        self.last_decrease = 0.0
+
+
+class AimdController:
+    def __init__(self, initial_limit: int, max_limit: int = AIMD_MAX_LIMIT, latency_target: float = AIMD_LATENCY_TARGET_SECONDS):
+        self.initial_limit = initial_limit
+        self.max_limit = max(max_limit, initial_limit)
+        self.latency_target = latency_target
+        self._hosts: Dict[str, _HostLimit] = {}
+        self._library_hosts: Dict[str, str] = {}
+        self._history: deque = deque(maxlen=HISTORY_KEPT)
+        self._memory_checked_at = 0.0
+        self._memory_pressure = False
+
+    def register_library(self, library_name: str, url: str):
+        """Map a library to the host its catalog lives on, so libraries sharing a host share a limit."""
+        self._library_hosts[library_name] = (urlparse(url).hostname or library_name).lower()
+
+    def host_key(self, library_name: str) -> str:
+        """The key the library's limit is kept under (shared by libraries on one host)."""
+        return self._library_hosts.get(library_name, library_name)
+
+    def _host(self, library_name: str) -> _HostLimit:
+        host = self.host_key(library_name)
+        if host not in self._hosts:
+            self._hosts[host] = _HostLimit(float(self.initial_limit))
+        return self._hosts[host]
+
+    def limit(self, library_name: str) -> int:
+        return max(AIMD_MIN_LIMIT, int(self._host(library_name).limit))
+
+    def memory_pressure(self) -> bool:
+        """Low free host memory or a browser close to its restart threshold (sampled every few seconds)."""
+        now = time.monotonic()
+        if now - self._memory_checked_at >= MEMORY_SAMPLE_SECONDS:
+            self._memory_checked_at = now
+            available = _host_available_mb()
+            rss = browser_pool.stats().get("rss_mb")
+            self._memory_pressure = (
+                (available is not None and available < HOST_MIN_AVAILABLE_MB)
+                or (rss is not None and rss > BROWSER_MAX_RSS_MB * BROWSER_RSS_PRESSURE_FRACTION)
+            )
+        return self._memory_pressure
+
+    def _record_change(self, library_name: str, state: _HostLimit, before: int, reason: str):
+        after = int(state.limit)
+        if after != before:
+            self._history.append({
+                "at": datetime.utcnow().isoformat(timespec="seconds"),
+                "host": self.host_key(library_name),
+                "from": before,
+                "to": after,
+                "reason": reason,
+            })
+            print(f"DEBUG: Concurrency limit for {library_name} {before} -> {after} ({reason})")
+
+    def record(self, library_name: str, duration: float, timed_out: bool, in_flight: int):
+        """Feed back one finished job; ``in_flight`` is how many jobs on the library's host were running with it."""
+        state = self._host(library_name)
+        before = int(state.limit)
+        if not timed_out:
+            state.avg_latency = duration if state.avg_latency is None else 0.8 * state.avg_latency + 0.2 * duration
+
+        reason = None
+        if timed_out:
+            reason = "timeout"
+        elif duration > 2 * self.latency_target:
+            reason = f"slow job ({duration:.0f} s)"
+        elif self.memory_pressure():
+            reason = "memory pressure"
+
+        now = time.monotonic()
+        if reason is not None:
+            if now - state.last_decrease >= AIMD_DECREASE_COOLDOWN_SECONDS:
+                state.limit = max(float(AIMD_MIN_LIMIT), state.limit * AIMD_DECREASE_FACTOR)
+                state.last_decrease = now
+                state.decreases += 1
+                self._record_change(library_name, state, before, reason)
+            return
+
+        state.successes += 1
+        # Only grow a limit we're actually using, and only while latency is healthy
+        if duration <= self.latency_target and in_flight >= int(state.limit):
+            state.limit = min(float(self.max_limit), state.limit + 1.0 / state.limit)
+            self._record_change(library_name, state, before, "healthy")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": ADAPTIVE_CONCURRENCY_ENABLED,
+            "max_limit": self.max_limit,
+            "latency_target_seconds": self.latency_target,
+            "memory_pressure": self._memory_pressure,
+            "hosts": {
+                host: {
+                    "limit": max(AIMD_MIN_LIMIT, int(state.limit)),
+                    "limit_exact": round(state.limit, 2),
+                    "avg_latency_seconds": round(state.avg_latency, 2) if state.avg_latency is not None else None,
+                    "successes": state.successes,
+                    "decreases": state.decreases,
+                }
+                for host, state in self._hosts.items()
+            },
+            "history": list(self._history),
+        }
@@ -0,0 +1,148 @@
+"""
+Browserless search for BiblioCommons catalogs.
+
+BiblioCommons serves search results in the initial HTML, so for catalogs on
+bibliocommons.com we can fetch the page with a pooled async HTTP client and
+parse it with BeautifulSoup, using the same selectors as the browser path.
+Callers fall back to Playwright whenever this returns None.
+"""
+import os
+from typing import Optional, List, Dict, Any
+from urllib.parse import urlparse
+import httpx
+from bs4 import BeautifulSoup
+from services.browser_pool import CONTEXT_OPTIONS
+from services.search_parsing import (
+    RESULT_ITEM_SELECTOR, TITLE_SELECTORS, AUTHOR_SELECTORS, AVAILABILITY_SELECTORS, ISBN_SELECTOR,
+)
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# --- Configuration ---
+HTTP_SEARCH_ENABLED = os.getenv("HTTP_SEARCH_ENABLED", "true").lower() not in ("0", "false", "no")
+HTTP_SEARCH_TIMEOUT_SECONDS = float(os.getenv("HTTP_SEARCH_TIMEOUT_SECONDS", "10"))
+
+NO_RESULTS_SELECTORS = ['.no-results', '.empty-results']
+
+# Elements that put their text on its own line in innerText
+BLOCK_TAGS = [
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "li", "main", "nav", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul",
+]
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared keep-alive client, created on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={
+                "User-Agent": CONTEXT_OPTIONS["user_agent"],
+                "Accept": "text/html,application/xhtml+xml",
+                "Accept-Language": "en-US,en;q=0.9",
+            },
+            timeout=HTTP_SEARCH_TIMEOUT_SECONDS,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def is_bibliocommons_url(url: str) -> bool:
+    host = (urlparse(url).hostname or "").lower()
+    return host == "bibliocommons.com" or host.endswith(".bibliocommons.com")
+
+
+def _text(element) -> str:
+    """
+    Approximate the browser's innerText, which the DOM extractors read: inline
+    elements run together on one line, each block element starts a new one.
+    """
+    if element is None:
+        return ""
+    lines: List[str] = []
+    current: List[str] = []
+    block = None
+    for string in element.strings:
+        parent = string.find_parent(BLOCK_TAGS)
+        if parent is not block:
+            lines.append("".join(current))
+            current = []
+            block = parent
+        current.append(string)
+    lines.append("".join(current))
+    return "\n".join(filter(None, (" ".join(line.split()) for line in lines)))
+
+
+def _first(item, selectors: List[str]):
+    for selector in selectors:
+        element = item.select_one(selector)
+        if element is not None:
+            return element
+    return None
+
+
+def parse_search_html(html: str, limit: int = 30) -> Optional[List[Dict[str, Any]]]:
+    """
+    Turn a search results page into raw result records.
+
+    Returns an empty list when the page says there are no results and None when
+    the page doesn't contain anything we recognize.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    items = soup.select(RESULT_ITEM_SELECTOR)
+    if not items:
+        if any(soup.select_one(selector) for selector in NO_RESULTS_SELECTORS):
+            return []
+        return None
+
+    records = []
+    for item in items[:limit]:
+        title_text, title_href = "", ""
+        for selector in TITLE_SELECTORS:
+            element = item.select_one(selector)
+            if element is not None and _text(element):
+                title_text = _text(element)
+                title_href = element.get("href") or ""
+                break
+        records.append({
+            "title_text": title_text,
+            "title_href": title_href,
+            "item_text": _text(item),
+            "author": _text(_first(item, AUTHOR_SELECTORS)),
+            "availability": _text(_first(item, AVAILABILITY_SELECTORS)),
+            "isbn_text": _text(item.select_one(ISBN_SELECTOR)),
+        })
+    return records
+
+
+async def fetch_search_records(url: str, limit: int = 30, timeout: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+    """Fetch and parse a search page; None means the response was unusable."""
+    try:
+        if timeout is not None:
+            response = await get_client().get(url, timeout=timeout)
+        else:
+            response = await get_client().get(url)
+    except httpx.HTTPError as e:
+        print(f"DEBUG: HTTP search request failed: {e}")
+        return None
+
+    if response.status_code != 200 or "html" not in response.headers.get("content-type", ""):
+        print(f"DEBUG: HTTP search got unusable response ({response.status_code})")
+        return None
+
+    return parse_search_html(response.text, limit=limit)
@@ -31,3 +31,60 @@ def update_hold_status(db: Session, hold_id: int, status_update: dict):
         db.refresh(db_hold)
     return db_hold
 
+
+def _first_check_time(hold_data: dict):
+    """When the background refresh should first look at a hold that was just placed."""
+    # Imported here because hold_refresh_service itself imports book_service
+    from services.hold_refresh_service import next_check_time
+    return next_check_time(hold_data.get("status"), hold_data.get("queue_position"))
+
+def record_placed_hold(db: Session, user_id: int, hold_data: dict):
+    """Save a hold returned by library_service.place_hold along with its status fields."""
+    hold_create = schemas.HoldCreate(
+        user_id=user_id,
+        title=hold_data["title"],
+        author=hold_data.get("author"),
+        isbn=hold_data.get("isbn"),
+        library_name=hold_data["library_name"],
+        library_item_id=hold_data["library_item_id"]
+    )
+    db_hold = create_hold(db=db, hold=hold_create)
+    
+    # Extract only the status fields for the update
+    status_fields = {k: v for k, v in hold_data.items() 
+                    if k in ["status", "queue_position", "estimated_wait_days", "last_checked"]}
+    status_fields["next_check_at"] = _first_check_time(hold_data)
+    return update_hold_status(db, db_hold.id, status_fields)
+
+def record_placed_holds(db: Session, user_id: int, hold_datas: list):
+    """Save several placed holds (with their status fields) in a single transaction."""
+    db_holds = []
+    for hold_data in hold_datas:
+        db_hold = models.Hold(
+            user_id=user_id,
+            title=hold_data["title"],
+            author=hold_data.get("author"),
+            isbn=hold_data.get("isbn"),
+            library_name=hold_data["library_name"],
+            library_item_id=hold_data["library_item_id"],
+            next_check_at=_first_check_time(hold_data),
+            **{k: v for k, v in hold_data.items()
+               if k in ["status", "queue_position", "estimated_wait_days", "last_checked"]}
+        )
+        db.add(db_hold)
+        db_holds.append(db_hold)
+    db.commit()
+    for db_hold in db_holds:
+        db.refresh(db_hold)
+    return db_holds
+
+def update_holds_status_bulk(db: Session, status_updates: dict):
+    """Apply {hold_id: status fields} to many holds in a single transaction."""
+    if not status_updates:
+        return 0
+    db_holds = db.query(models.Hold).filter(models.Hold.id.in_(list(status_updates.keys()))).all()
+    for db_hold in db_holds:
+        for key, value in status_updates[db_hold.id].items():
+            setattr(db_hold, key, value)
+    db.commit()
+    return len(db_holds)
@@ -0,0 +1,383 @@
+"""
+Shared Playwright browser pool.
+
+A single Chromium instance is launched for the lifetime of the app (see the
+lifespan handler in main.py) and isolated BrowserContexts are handed out from
+a bounded pool, so warm requests never pay the browser launch cost.
+
+Chromium leaks memory over thousands of pages, so contexts are retired after
+a number of pages or an age limit, and a watchdog samples the RSS of the
+browser's process tree (from /proc) and restarts the browser when it grows
+past a threshold, after letting in-flight jobs drain.
+"""
+import asyncio
+import os
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+from playwright.async_api import async_playwright, Playwright, Browser, BrowserContext
+
+# --- Configuration ---
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "4"))
+CONTEXT_MAX_USES = int(os.getenv("BROWSER_CONTEXT_MAX_USES", "50"))
+CONTEXT_MAX_PAGES = int(os.getenv("BROWSER_CONTEXT_MAX_PAGES", "100"))
+CONTEXT_MAX_AGE_SECONDS = int(os.getenv("BROWSER_CONTEXT_MAX_AGE_SECONDS", "600"))
+
+# Memory watchdog
+BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "1500"))
+BROWSER_MEMORY_CHECK_SECONDS = float(os.getenv("BROWSER_MEMORY_CHECK_SECONDS", "30"))
+BROWSER_DRAIN_TIMEOUT_SECONDS = float(os.getenv("BROWSER_DRAIN_TIMEOUT_SECONDS", "60"))
+RECYCLE_EVENTS_KEPT = 20
+
+LAUNCH_ARGS = [
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-blink-features=AutomationControlled',  # Hide automation
+    '--disable-features=IsolateOrigins,site-per-process'
+]
+
+# Realistic viewport and user agent for every context
+CONTEXT_OPTIONS = {
+    "viewport": {'width': 1920, 'height': 1080},
+    "user_agent": 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+}
+
+# Extra properties to avoid detection
+STEALTH_INIT_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
+    window.chrome = {runtime: {}};
+"""
+
+
+# --- Process Memory (/proc, Linux only) ---
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _read_parent_pids() -> Dict[int, int]:
+    """pid -> parent pid for every process we can see."""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces, so split after its closing paren
+                fields = f.read().rsplit(")", 1)[1].split()
+            parents[int(entry)] = int(fields[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    return parents
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode(errors="replace")
+    except OSError:
+        return ""
+
+
+def browser_tree_rss_mb() -> Optional[float]:
+    """
+    RSS of the Playwright driver and every Chromium process under it, in MB.
+    None when /proc isn't available.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    parents = _read_parent_pids()
+    children: Dict[int, List[int]] = {}
+    for pid, parent in parents.items():
+        children.setdefault(parent, []).append(pid)
+
+    # Our direct children that are the Playwright driver (not scrape workers etc.)
+    roots = [pid for pid in children.get(os.getpid(), []) if "playwright" in _cmdline(pid)]
+    total = 0
+    stack = list(roots)
+    while stack:
+        pid = stack.pop()
+        total += _rss_bytes(pid)
+        stack.extend(children.get(pid, []))
+    return round(total / (1024 * 1024), 1)
+
+
+class PooledContext:
+    """A BrowserContext plus the bookkeeping the pool needs to recycle it."""
+
+    def __init__(self, context: BrowserContext, reusable: bool):
+        self.context = context
+        self.reusable = reusable
+        self.uses = 0
+        self.pages = 0
+        self.created_at = time.monotonic()
+        context.on("page", self._on_page)
+
+    def _on_page(self, page):
+        self.pages += 1
+
+    def retire_reason(self, max_uses: int) -> Optional[str]:
+        """Why this context should not be reused, or None if it's still good."""
+        if self.uses >= max_uses:
+            return "uses"
+        if self.pages >= CONTEXT_MAX_PAGES:
+            return "pages"
+        if time.monotonic() - self.created_at >= CONTEXT_MAX_AGE_SECONDS:
+            return "age"
+        return None
+
+
+class BrowserPool:
+    """Owns one long-lived Chromium process and a bounded set of contexts."""
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_uses: int = CONTEXT_MAX_USES):
+        self.size = size
+        self.max_uses = max_uses
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self._idle: List[PooledContext] = []
+        self._semaphore = asyncio.Semaphore(size)
+        self._lock = asyncio.Lock()
+        self._in_use = 0
+        self._launches = 0
+        self._contexts_created = 0
+        self._contexts_recycled = 0
+        self._retired_by_reason: Counter = Counter()
+        # Cleared while the browser is being drained for a restart
+        self._accepting = asyncio.Event()
+        self._accepting.set()
+        self._watchdog: Optional[asyncio.Task] = None
+        self._rss_mb: Optional[float] = None
+        self._peak_rss_mb: Optional[float] = None
+        self._browser_restarts = 0
+        self._recycle_events: deque = deque(maxlen=RECYCLE_EVENTS_KEPT)
+
+    @property
+    def is_running(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def start(self):
+        """Launch Playwright and Chromium if they are not already running."""
+        if self._watchdog is None and BROWSER_MEMORY_CHECK_SECONDS > 0:
+            self._watchdog = asyncio.create_task(self._watch_memory())
+        async with self._lock:
+            await self._ensure_browser()
+
+    async def stop(self):
+        """Close every pooled context, the browser and the Playwright driver."""
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            await asyncio.gather(self._watchdog, return_exceptions=True)
+            self._watchdog = None
+        async with self._lock:
+            for pooled in self._idle:
+                try:
+                    await pooled.context.close()
+                except Exception:
+                    pass
+            self._idle.clear()
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception:
+                    pass
+                self._browser = None
+            if self._playwright is not None:
+                try:
+                    await self._playwright.stop()
+                except Exception:
+                    pass
+                self._playwright = None
+            print("DEBUG: Browser pool stopped")
+
+    async def _ensure_browser(self) -> Browser:
+        """Health check: (re)launch Chromium when it is missing or has crashed."""
+        if self.is_running:
+            return self._browser
+
+        if self._browser is not None:
+            print("DEBUG: Browser disconnected - relaunching")
+            # Contexts of a dead browser are unusable
+            self._idle.clear()
+            self._browser = None
+
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+
+        self._browser = await self._playwright.chromium.launch(headless=True, args=LAUNCH_ARGS)
+        self._launches += 1
+        print(f"DEBUG: Launched pooled Chromium (launch #{self._launches})")
+        return self._browser
+
+    async def _new_context(self, storage_state: Optional[Dict[str, Any]], reusable: bool) -> PooledContext:
+        browser = await self._ensure_browser()
+        options = dict(CONTEXT_OPTIONS)
+        if storage_state is not None:
+            options["storage_state"] = storage_state
+        context = await browser.new_context(**options)
+        await context.add_init_script(STEALTH_INIT_SCRIPT)
+        self._contexts_created += 1
+        return PooledContext(context, reusable)
+
+    async def _checkout(self, storage_state: Optional[Dict[str, Any]], private: bool) -> PooledContext:
+        # Hold new work back while the browser is being drained for a restart
+        await self._accepting.wait()
+        async with self._lock:
+            if private or storage_state is not None:
+                # Authenticated work always gets a fresh context that is never shared
+                return await self._new_context(storage_state, reusable=False)
+
+            if not self.is_running:
+                await self._ensure_browser()
+            while self._idle:
+                pooled = self._idle.pop()
+                reason = pooled.retire_reason(self.max_uses)
+                if reason is None:
+                    return pooled
+                # Went stale while idle
+                await self._retire(pooled, reason)
+            return await self._new_context(None, reusable=True)
+
+    async def _retire(self, pooled: PooledContext, reason: str):
+        self._contexts_recycled += 1
+        self._retired_by_reason[reason] += 1
+        try:
+            await pooled.context.close()
+        except Exception:
+            pass  # The browser may already be gone
+
+    async def _checkin(self, pooled: PooledContext, healthy: bool):
+        pooled.uses += 1
+        if not healthy:
+            reason = "unhealthy"
+        elif not pooled.reusable:
+            reason = "private"
+        elif not self.is_running or not self._accepting.is_set():
+            reason = "browser_restart"
+        else:
+            reason = pooled.retire_reason(self.max_uses)
+
+        if reason is None:
+            try:
+                for page in list(pooled.context.pages):
+                    await page.close()
+                await pooled.context.clear_cookies()
+            except Exception as e:
+                print(f"DEBUG: Failed to reset pooled context, discarding it: {e}")
+                reason = "reset_failed"
+
+        if reason is None:
+            async with self._lock:
+                self._idle.append(pooled)
+            return
+
+        await self._retire(pooled, reason)
+
+    # --- Memory Watchdog ---
+
+    async def _watch_memory(self):
+        while True:
+            await asyncio.sleep(BROWSER_MEMORY_CHECK_SECONDS)
+            try:
+                rss_mb = await asyncio.to_thread(browser_tree_rss_mb)
+                if rss_mb is None:
+                    continue
+                self._rss_mb = rss_mb
+                self._peak_rss_mb = max(self._peak_rss_mb or 0, rss_mb)
+                if rss_mb > BROWSER_MAX_RSS_MB and self.is_running:
+                    await self.restart_browser(f"rss {rss_mb:.0f} MB > {BROWSER_MAX_RSS_MB} MB", rss_mb)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Browser memory watchdog error: {e}")
+
+    async def restart_browser(self, reason: str, rss_mb: Optional[float] = None):
+        """
+        Drain and restart Chromium: stop handing out contexts, wait up to
+        BROWSER_DRAIN_TIMEOUT_SECONDS for in-flight jobs to finish, then close
+        the browser and launch a fresh one.
+        """
+        if not self._accepting.is_set():
+            return  # Already restarting
+        print(f"DEBUG: Restarting browser ({reason}), draining {self._in_use} in-flight jobs")
+        self._accepting.clear()
+        started = time.monotonic()
+        try:
+            while self._in_use and time.monotonic() - started < BROWSER_DRAIN_TIMEOUT_SECONDS:
+                await asyncio.sleep(0.2)
+            abandoned = self._in_use
+            async with self._lock:
+                for pooled in self._idle:
+                    await self._retire(pooled, "browser_restart")
+                self._idle.clear()
+                if self._browser is not None:
+                    try:
+                        await self._browser.close()
+                    except Exception:
+                        pass
+                    self._browser = None
+                await self._ensure_browser()
+            self._browser_restarts += 1
+            self._recycle_events.append({
+                "at": datetime.utcnow().isoformat(timespec="seconds"),
+                "reason": reason,
+                "rss_mb": rss_mb,
+                "drain_seconds": round(time.monotonic() - started, 1),
+                "abandoned_jobs": abandoned,
+            })
+        finally:
+            self._accepting.set()
+
+    @asynccontextmanager
+    async def context(self, storage_state: Optional[Dict[str, Any]] = None, private: bool = False):
+        """
+        Borrow a BrowserContext for the duration of the block.
+
+        Anonymous contexts are returned to the pool afterwards with their pages
+        closed and cookies cleared. Contexts created with ``private=True`` or a
+        ``storage_state`` carry user sessions and are closed on release.
+        """
+        async with self._semaphore:
+            pooled = await self._checkout(storage_state, private)
+            self._in_use += 1
+            healthy = True
+            try:
+                yield pooled.context
+            except BaseException:
+                healthy = False
+                raise
+            finally:
+                self._in_use -= 1
+                await self._checkin(pooled, healthy)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool state for debugging and metrics."""
+        return {
+            "running": self.is_running,
+            "size": self.size,
+            "in_use": self._in_use,
+            "idle": len(self._idle),
+            "launches": self._launches,
+            "contexts_created": self._contexts_created,
+            "contexts_recycled": self._contexts_recycled,
+            "contexts_retired_by_reason": dict(self._retired_by_reason),
+            "draining": not self._accepting.is_set(),
+            "rss_mb": self._rss_mb,
+            "peak_rss_mb": self._peak_rss_mb,
+            "max_rss_mb": BROWSER_MAX_RSS_MB,
+            "browser_restarts": self._browser_restarts,
+            "recycle_events": list(self._recycle_events),
+        }
+
+
+# Shared pool used by library_service
+browser_pool = BrowserPool()
@@ -0,0 +1,209 @@
+"""
+Admission control for browser work.
+
+Every job that needs a browser asks the scheduler for a slot first. Slots are
+limited globally and per library, waiting jobs are served by priority
+(interactive work before background refreshes), and when the queue is full or
+a job waits too long the caller gets a SchedulerBusyError carrying a
+Retry-After hint instead of piling another Chromium page onto the host.
+
+The per-library cap is adaptive: every finished job is reported to an AIMD
+controller (see adaptive_concurrency), which raises or cuts the cap for the
+library's host. Libraries on the same host share that cap, so their running
+jobs are counted together.
+"""
+import asyncio
+import bisect
+import itertools
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List
+
+from services.browser_pool import BROWSER_POOL_SIZE
+from services.adaptive_concurrency import AimdController, ADAPTIVE_CONCURRENCY_ENABLED
+from services.deadline import ScrapeTimeoutError
+
+# --- Configuration ---
+BROWSER_MAX_CONCURRENCY = int(os.getenv("BROWSER_MAX_CONCURRENCY", str(BROWSER_POOL_SIZE)))
+BROWSER_MAX_PER_LIBRARY = int(os.getenv("BROWSER_MAX_PER_LIBRARY", "2"))
+BROWSER_MAX_QUEUE = int(os.getenv("BROWSER_MAX_QUEUE", "50"))
+BROWSER_MAX_WAIT_SECONDS = float(os.getenv("BROWSER_MAX_WAIT_SECONDS", "30"))
+
+# Priority classes (lower runs first)
+PRIORITY_INTERACTIVE = 0   # Searches and hold placements a user is waiting on
+PRIORITY_BATCH = 5         # Bulk work a user asked for but isn't blocked on
+PRIORITY_BACKGROUND = 10   # Scheduled hold status refreshes
+
+
+class SchedulerBusyError(Exception):
+    """Raised when a browser job can't be admitted; maps to a 429/503 with Retry-After."""
+
+    def __init__(self, message: str, retry_after: int, status_code: int = 503):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class _Waiter:
+    def __init__(self, priority: int, seq: int, library: str, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.library = library
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class BrowserJobScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = BROWSER_MAX_CONCURRENCY,
+        max_per_library: int = BROWSER_MAX_PER_LIBRARY,
+        max_queue: int = BROWSER_MAX_QUEUE,
+        max_wait_seconds: float = BROWSER_MAX_WAIT_SECONDS,
+        controller: Optional[AimdController] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_library = max_per_library
+        self.controller = controller
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._running = 0
+        self._running_by_library: Dict[str, int] = defaultdict(int)
+        # Running jobs per cap key (the host, when the AIMD controller is on)
+        self._running_by_limit: Dict[str, int] = defaultdict(int)
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        # Exponentially weighted job duration, used for Retry-After estimates
+        self._avg_job_seconds = 5.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def library_limit(self, library: str) -> int:
+        if self.controller is not None:
+            return self.controller.limit(library)
+        return self.max_per_library
+
+    def _limit_key(self, library: str) -> str:
+        if self.controller is not None:
+            return self.controller.host_key(library)
+        return library
+
+    def _has_capacity(self, library: str) -> bool:
+        return (
+            self._running < self.max_concurrency
+            and self._running_by_limit[self._limit_key(library)] < self.library_limit(library)
+        )
+
+    def _grant(self, library: str):
+        self._running += 1
+        self._running_by_library[library] += 1
+        self._running_by_limit[self._limit_key(library)] += 1
+        self.admitted += 1
+
+    def _dispatch(self):
+        """Hand free slots to waiters in priority order, skipping libraries at their cap."""
+        for waiter in list(self._waiters):
+            if self._running >= self.max_concurrency:
+                break
+            if waiter.future.done():
+                self._waiters.remove(waiter)
+                continue
+            if self._has_capacity(waiter.library):
+                self._waiters.remove(waiter)
+                self._grant(waiter.library)
+                waiter.future.set_result(True)
+
+    def _retry_after(self) -> int:
+        backlog = len(self._waiters) + self._running
+        return max(1, int(self._avg_job_seconds * backlog / max(1, self.max_concurrency)))
+
+    async def acquire(self, library: str, priority: int = PRIORITY_INTERACTIVE, max_wait: Optional[float] = None):
+        """Wait for a slot for ``library``; raises SchedulerBusyError instead of waiting forever."""
+        # Waiters are only ever queued while blocked (_dispatch runs on every
+        # release), so free capacity here can't be jumping anyone's place
+        if self._has_capacity(library):
+            self._grant(library)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerBusyError("Too many browser jobs queued, try again later", self._retry_after(), status_code=429)
+
+        waiter = _Waiter(priority, next(self._seq), library, asyncio.get_running_loop().create_future())
+        bisect.insort(self._waiters, waiter)
+        timeout = self.max_wait_seconds if max_wait is None else max_wait
+        try:
+            await asyncio.wait({waiter.future}, timeout=timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        if not (waiter.future.done() and not waiter.future.cancelled()):
+            self._abandon(waiter)
+            self.timed_out += 1
+            raise SchedulerBusyError(f"No browser slot became free within {timeout:.0f} s", self._retry_after())
+
+    def _abandon(self, waiter: _Waiter):
+        if waiter.future.done() and not waiter.future.cancelled():
+            # The slot was granted just as we gave up; hand it back
+            self.release(waiter.library)
+        else:
+            waiter.future.cancel()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, library: str, duration: Optional[float] = None):
+        self._running -= 1
+        self._running_by_library[library] -= 1
+        self._running_by_limit[self._limit_key(library)] -= 1
+        if duration is not None:
+            self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * duration
+        self._dispatch()
+
+    @asynccontextmanager
+    async def job(self, library: str, priority: int = PRIORITY_INTERACTIVE, max_wait: Optional[float] = None):
+        """Hold a browser slot for the duration of the block."""
+        await self.acquire(library, priority, max_wait)
+        started = time.monotonic()
+        timed_out = False
+        finished = False
+        try:
+            yield
+            finished = True
+        except Exception as e:
+            # Playwright's TimeoutError isn't a builtin TimeoutError subclass
+            timed_out = isinstance(e, (TimeoutError, ScrapeTimeoutError)) or type(e).__name__ == "TimeoutError"
+            finished = True
+            raise
+        finally:
+            duration = time.monotonic() - started
+            # Cancelled jobs say nothing about the library's health
+            if finished and self.controller is not None:
+                self.controller.record(library, duration, timed_out, self._running_by_limit[self._limit_key(library)])
+            self.release(library, duration)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "running_by_library": {name: count for name, count in self._running_by_library.items() if count},
+            "queued": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_per_library": self.max_per_library,
+            "library_limits": {name: self.library_limit(name) for name in self._running_by_library},
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_job_seconds": round(self._avg_job_seconds, 2),
+        }
+
+
+# Shared scheduler used by library_service
+browser_scheduler = BrowserJobScheduler(
+    controller=AimdController(BROWSER_MAX_PER_LIBRARY) if ADAPTIVE_CONCURRENCY_ENABLED else None,
+)
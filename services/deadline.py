@@ -0,0 +1,103 @@
+"""
+Deadlines for scraping operations.
+
+A public library_service operation (search, place hold, read holds) gets one
+overall time budget. The budget is kept in a context variable for the
+duration of the call, and every navigation, wait and selector probe asks for
+its timeout through budget_ms(), which clamps the step's usual timeout to
+whatever is left. When nothing is left the step fails right away with a
+ScrapeTimeoutError naming it, instead of stacking one more full timeout on top.
+"""
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+# Steps with less than this left fail immediately rather than start
+MIN_STEP_MS = 100
+
+
+class ScrapeTimeoutError(Exception):
+    """An operation ran out of its time budget; ``step`` names where. Maps to a 504."""
+
+    def __init__(self, step: str, budget_seconds: Optional[float] = None):
+        budget = f" of {budget_seconds:.0f} s" if budget_seconds is not None else ""
+        super().__init__(f"Ran out of the time budget{budget} at step '{step}'")
+        self.step = step
+        self.budget_seconds = budget_seconds
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.budget_seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() * 1000 < MIN_STEP_MS
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("scrape_deadline", default=None)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float], detached: bool = False):
+    """
+    Run the block under a deadline ``seconds`` from now. Nested scopes can only
+    shorten the budget, never extend the caller's, unless ``detached`` (for work
+    shared with other callers, which each bound their own wait instead).
+    """
+    parent = None if detached else _current.get()
+    if seconds is None or (parent is not None and parent.remaining() <= seconds):
+        yield parent
+        return
+    token = _current.set(Deadline(seconds))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def check(step: str):
+    """Fail fast if the current deadline has passed."""
+    deadline = _current.get()
+    if deadline is not None and deadline.expired():
+        raise ScrapeTimeoutError(step, deadline.budget_seconds)
+
+
+def budget_ms(step: str, default_ms: float) -> float:
+    """The step's usual timeout, clamped to what's left of the current deadline."""
+    deadline = _current.get()
+    if deadline is None:
+        return default_ms
+    check(step)
+    return min(default_ms, deadline.remaining() * 1000)
+
+
+def budget_seconds(step: str, default_seconds: float) -> float:
+    return budget_ms(step, default_seconds * 1000) / 1000
+
+
+@asynccontextmanager
+async def step(name: str):
+    """
+    Name a step so a timeout caused by the deadline (rather than the step's own
+    limit) surfaces as a ScrapeTimeoutError for that step.
+    """
+    check(name)
+    try:
+        yield
+    except (PlaywrightTimeoutError, asyncio.TimeoutError) as e:
+        deadline = _current.get()
+        if deadline is not None and deadline.expired():
+            raise ScrapeTimeoutError(name, deadline.budget_seconds) from e
+        raise
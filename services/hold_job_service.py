@@ -0,0 +1,257 @@
+"""
+Asynchronous hold placement jobs.
+
+Instead of keeping the HTTP request open for the whole login + hold flow,
+/holds/place?async_mode=true stores a HoldJob row and returns its id. A small
+pool of asyncio workers claims queued jobs from the hold_jobs table, places
+the holds with retries and records the resulting Hold, and clients poll
+/holds/jobs/{id} for progress.
+"""
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, List
+from sqlalchemy.orm import Session
+
+from db.database import SessionLocal
+from db.models import HoldJob, User
+from schemas.schemas import HoldBase, PlaceHoldRequest
+from services import book_service, library_service
+from services.browser_scheduler import SchedulerBusyError, PRIORITY_BATCH
+
+# --- Configuration ---
+HOLD_JOB_WORKERS = int(os.getenv("HOLD_JOB_WORKERS", "2"))
+HOLD_JOB_MAX_ATTEMPTS = int(os.getenv("HOLD_JOB_MAX_ATTEMPTS", "3"))
+HOLD_JOB_POLL_SECONDS = float(os.getenv("HOLD_JOB_POLL_SECONDS", "2"))
+HOLD_JOB_RETRY_BASE_SECONDS = 30
+# A job stuck in "running" this long belonged to a worker (or node) that died
+HOLD_JOB_STALE_MINUTES = 15
+# How often the workers look for such jobs
+HOLD_JOB_REQUEUE_CHECK_SECONDS = 60
+
+# --- Job Persistence ---
+
+def enqueue_hold_job(db: Session, user_id: int, hold: HoldBase) -> HoldJob:
+    """Persist a queued hold placement job."""
+    job = HoldJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        title=hold.title,
+        author=hold.author,
+        isbn=hold.isbn,
+        library_name=hold.library_name,
+        library_item_id=hold.library_item_id,
+        status="queued",
+        progress="Queued",
+        max_attempts=HOLD_JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    hold_job_workers.notify()
+    return job
+
+def get_hold_job(db: Session, job_id: str, user_id: int) -> Optional[HoldJob]:
+    """Get a job by id, only if it belongs to the user"""
+    return db.query(HoldJob).filter(HoldJob.id == job_id, HoldJob.user_id == user_id).first()
+
+def _claim_next_job(db: Session) -> Optional[HoldJob]:
+    """
+    Atomically move the oldest due job from "queued" to "running". The
+    conditional UPDATE makes sure two workers can never claim the same job.
+    """
+    now = datetime.utcnow()
+    candidates = (
+        db.query(HoldJob.id)
+        .filter(HoldJob.status == "queued", HoldJob.next_attempt_at <= now)
+        .order_by(HoldJob.created_at)
+        .limit(5)
+        .all()
+    )
+    for (job_id,) in candidates:
+        claimed = (
+            db.query(HoldJob)
+            .filter(HoldJob.id == job_id, HoldJob.status == "queued")
+            .update(
+                {
+                    HoldJob.status: "running",
+                    HoldJob.attempts: HoldJob.attempts + 1,
+                    HoldJob.progress: "Starting",
+                    HoldJob.updated_at: now,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if claimed:
+            return db.query(HoldJob).filter(HoldJob.id == job_id).first()
+    return None
+
+def _requeue_stale_jobs(db: Session) -> int:
+    """Return jobs left "running" by a crashed worker to the queue."""
+    cutoff = datetime.utcnow() - timedelta(minutes=HOLD_JOB_STALE_MINUTES)
+    count = (
+        db.query(HoldJob)
+        .filter(HoldJob.status == "running", HoldJob.updated_at < cutoff)
+        .update({HoldJob.status: "queued", HoldJob.progress: "Requeued after its worker stopped"}, synchronize_session=False)
+    )
+    db.commit()
+    return count
+
+def _set_progress(db: Session, job: HoldJob, progress: str):
+    job.progress = progress
+    db.commit()
+
+# --- Job Execution ---
+
+async def _run_job(db: Session, job: HoldJob):
+    user = db.query(User).filter(User.id == job.user_id).first()
+    if not user or not user.library_card_number or not user.library_pin:
+        job.status = "failed"
+        job.error = "Library card credentials not set"
+        job.progress = "Failed"
+        db.commit()
+        return
+
+    request = PlaceHoldRequest(
+        user_id=user.id,
+        title=job.title,
+        author=job.author,
+        isbn=job.isbn,
+        library_name=job.library_name,
+        library_item_id=job.library_item_id,
+        library_card_number=user.library_card_number,
+        library_pin=user.library_pin,
+    )
+
+    try:
+        _set_progress(db, job, "Placing hold on library website")
+        # Queued jobs are background work; interactive placements go first
+        hold_data = await library_service.place_hold(request, priority=PRIORITY_BATCH)
+    except asyncio.CancelledError:
+        # App shutdown - put the job back so the next start picks it up
+        job.status = "queued"
+        job.attempts -= 1
+        job.progress = "Interrupted, requeued"
+        db.commit()
+        raise
+    except SchedulerBusyError as e:
+        # Not the library's fault - try again once browser capacity frees up
+        job.status = "queued"
+        job.attempts -= 1
+        job.progress = "Waiting for browser capacity"
+        job.next_attempt_at = datetime.utcnow() + timedelta(seconds=e.retry_after)
+        db.commit()
+        return
+    except Exception as e:
+        print(f"❌ Hold job {job.id} attempt {job.attempts} failed: {e}")
+        job.error = str(e)
+        if job.attempts < job.max_attempts:
+            delay = HOLD_JOB_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1))
+            job.status = "queued"
+            job.progress = f"Retrying in {delay} s"
+            job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        else:
+            job.status = "failed"
+            job.progress = "Failed"
+        db.commit()
+        return
+
+    # The library has the hold now; a failure from here on must not place it again
+    try:
+        _set_progress(db, job, "Saving hold")
+        db_hold = book_service.record_placed_hold(db, user.id, hold_data)
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Hold job {job.id} placed its hold but could not save it: {e}")
+        job.status = "failed"
+        job.error = f"Hold was placed at the library but could not be saved: {e}"
+        job.progress = "Placed, not saved"
+        db.commit()
+        return
+
+    job.status = "succeeded"
+    job.hold_id = db_hold.id
+    job.error = None
+    job.progress = "Done"
+    db.commit()
+    print(f"DEBUG: Hold job {job.id} succeeded (hold {db_hold.id})")
+
+
+class HoldJobWorkerPool:
+    """N asyncio workers draining the hold_jobs table."""
+
+    def __init__(self, workers: int = HOLD_JOB_WORKERS):
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._requeue_checked_at = 0.0
+
+    def notify(self):
+        """Wake idle workers right away after a job is enqueued."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        if self._tasks or self.workers <= 0:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        db = SessionLocal()
+        try:
+            self._maybe_requeue_stale(db)
+        finally:
+            db.close()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"DEBUG: Started {self.workers} hold job workers")
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _maybe_requeue_stale(self, db: Session):
+        """
+        Requeue jobs abandoned by dead workers, at most every
+        HOLD_JOB_REQUEUE_CHECK_SECONDS. Runs on every node, so jobs of a node
+        that went away are picked up by the others.
+        """
+        now = time.monotonic()
+        if self._requeue_checked_at and now - self._requeue_checked_at < HOLD_JOB_REQUEUE_CHECK_SECONDS:
+            return
+        self._requeue_checked_at = now
+        requeued = _requeue_stale_jobs(db)
+        if requeued:
+            print(f"DEBUG: Requeued {requeued} stale hold jobs")
+
+    async def _worker(self, index: int):
+        while not self._stopping:
+            db = SessionLocal()
+            try:
+                self._maybe_requeue_stale(db)
+                job = _claim_next_job(db)
+                if job is not None:
+                    await _run_job(db, job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Hold job worker {index} error: {e}")
+            finally:
+                db.close()
+
+            # Nothing due - sleep until notified or the next poll
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), HOLD_JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Shared worker pool started in the app lifespan
+hold_job_workers = HoldJobWorkerPool()
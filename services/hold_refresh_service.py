@@ -0,0 +1,455 @@
+"""
+Batched hold status refresh.
+
+Instead of checking each tracked hold on its own, holds are grouped by user:
+every user with saved library card credentials gets one login and one read of
+the 'My Holds' page per library, and all of that user's holds are matched
+against the page by library item ID. Users are refreshed concurrently up to a
+small limit, and all updates are written back in one transaction.
+
+A background scheduler started in the app lifespan keeps holds fresh on its
+own. Every hold stores when it should next be looked at, picked from its
+state (soon for holds near the front of the queue, rarely for long queues,
+never once fulfilled) with jitter, and each tick refreshes only a few of the
+users that are due so the load on the library sites stays smooth.
+
+When several app replicas run, users are leased (see lease_service) before
+being refreshed, so each user's holds are read by only one node at a time.
+"""
+import asyncio
+import os
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from db.database import SessionLocal
+from db.models import Hold, User
+from services import book_service, library_service, lease_service
+from services.browser_scheduler import PRIORITY_BACKGROUND, PRIORITY_BATCH
+
+# --- Configuration ---
+HOLD_REFRESH_CONCURRENCY = int(os.getenv("HOLD_REFRESH_CONCURRENCY", "3"))
+HOLD_REFRESH_ENABLED = os.getenv("HOLD_REFRESH_ENABLED", "true").lower() not in ("0", "false", "no")
+HOLD_REFRESH_TICK_SECONDS = float(os.getenv("HOLD_REFRESH_TICK_SECONDS", "60"))
+# Users refreshed per tick; caps the background load no matter how many holds are due
+HOLD_REFRESH_USERS_PER_TICK = int(os.getenv("HOLD_REFRESH_USERS_PER_TICK", "5"))
+HOLD_REFRESH_JITTER = 0.2      # +/- fraction applied to every interval
+HOLD_REFRESH_RETRY_MINUTES = 30  # After a failed holds page read
+HOLD_REFRESH_MAX_WAIT_SECONDS = 60  # Longest a client may wait for fresh holds
+HOLD_REFRESH_POLL_SECONDS = 1.0  # How often to re-read holds another node is refreshing
+
+FINAL_STATUSES = ("Fulfilled",)
+
+# Check intervals by hold state (hours)
+CHECK_INTERVAL_READY_HOURS = 6       # Watch for the pickup so it can be marked fulfilled
+CHECK_INTERVAL_IN_TRANSIT_HOURS = 2
+CHECK_INTERVAL_SUSPENDED_HOURS = 24
+CHECK_INTERVAL_UNKNOWN_POSITION_HOURS = 6
+# (max queue position, hours) - the first matching bucket wins
+CHECK_INTERVAL_BY_QUEUE_POSITION = [
+    (3, 3),
+    (10, 12),
+    (50, 24),
+]
+CHECK_INTERVAL_LONG_QUEUE_HOURS = 72
+
+
+# --- Scheduling ---
+
+def check_interval(status: Optional[str], queue_position: Optional[int]) -> Optional[timedelta]:
+    """How long to wait before checking a hold in this state again; None = never."""
+    if status in FINAL_STATUSES:
+        return None
+    if status == "Ready for Pickup":
+        hours = CHECK_INTERVAL_READY_HOURS
+    elif status == "In Transit":
+        hours = CHECK_INTERVAL_IN_TRANSIT_HOURS
+    elif status == "Suspended":
+        hours = CHECK_INTERVAL_SUSPENDED_HOURS
+    elif queue_position is None:
+        hours = CHECK_INTERVAL_UNKNOWN_POSITION_HOURS
+    else:
+        hours = CHECK_INTERVAL_LONG_QUEUE_HOURS
+        for max_position, bucket_hours in CHECK_INTERVAL_BY_QUEUE_POSITION:
+            if queue_position <= max_position:
+                hours = bucket_hours
+                break
+    return timedelta(hours=hours)
+
+
+def _jittered(interval: timedelta) -> timedelta:
+    # Jitter keeps holds placed together from coming due together
+    return interval * random.uniform(1 - HOLD_REFRESH_JITTER, 1 + HOLD_REFRESH_JITTER)
+
+
+def next_check_time(status: Optional[str], queue_position: Optional[int], now: Optional[datetime] = None) -> Optional[datetime]:
+    interval = check_interval(status, queue_position)
+    if interval is None:
+        return None
+    return (now or datetime.utcnow()) + _jittered(interval)
+
+
+# --- Refresh ---
+
+def _missing_hold_update(hold: Hold) -> Optional[Dict[str, Any]]:
+    """
+    A hold that's no longer on the holds page was either picked up or
+    cancelled. Only a hold we last saw waiting on the shelf is assumed picked up.
+    """
+    if hold.status == "Ready for Pickup":
+        return {
+            "status": "Fulfilled",
+            "queue_position": None,
+            "estimated_wait_days": None,
+            "last_checked": datetime.utcnow(),
+        }
+    return None
+
+
+async def refresh_user_holds(user: User, holds: List[Hold], priority: int = PRIORITY_BACKGROUND) -> Dict[str, Any]:
+    """
+    Read each library's holds page once for this user. A library whose page
+    can't be read doesn't stop the others. Returns a dict with:
+    "updates" ({hold.id: status fields} for the holds that changed), "matched"
+    and "missing" (holds found / not found on a page that was read), and the
+    ids of holds whose page failed ("failed") or isn't supported ("unsupported").
+    """
+    holds_by_library: Dict[str, List[Hold]] = defaultdict(list)
+    for hold in holds:
+        holds_by_library[hold.library_name].append(hold)
+
+    result = {"updates": {}, "matched": 0, "missing": 0, "failed": [], "unsupported": []}
+    for library_name, library_holds in holds_by_library.items():
+        if not library_service.supports_hold_refresh(library_name):
+            result["unsupported"].extend(hold.id for hold in library_holds)
+            continue
+        try:
+            records = await library_service.fetch_hold_records(
+                library_name, user.library_card_number, user.library_pin, priority=priority
+            )
+        except Exception as e:
+            print(f"❌ Hold refresh failed for user {user.id} at {library_name}: {e}")
+            result["failed"].extend(hold.id for hold in library_holds)
+            continue
+        records_by_item = {record["library_item_id"]: record for record in records}
+        for hold in library_holds:
+            record = records_by_item.get(hold.library_item_id)
+            if record is not None:
+                result["matched"] += 1
+                result["updates"][hold.id] = library_service.hold_record_to_status(record)
+            else:
+                result["missing"] += 1
+                missing_update = _missing_hold_update(hold)
+                if missing_update is not None:
+                    result["updates"][hold.id] = missing_update
+    return result
+
+
+async def refresh_all_holds(db: Session, user_ids: Optional[List[int]] = None, priority: int = PRIORITY_BACKGROUND) -> Dict[str, int]:
+    """
+    Refresh every active hold, one holds-page read per user and library, and
+    schedule each hold's next check. Returns counts of what was checked and updated:
+    "checked" holds were found on their holds page, "missing" ones weren't,
+    "unsupported" ones are at a library whose holds page isn't read. A user
+    counts as failed when any of their holds pages couldn't be read; the
+    pages that were read are still applied.
+    """
+    query = db.query(Hold).filter(Hold.status.notin_(FINAL_STATUSES))
+    if user_ids is not None:
+        query = query.filter(Hold.user_id.in_(user_ids))
+    holds_by_user: Dict[int, List[Hold]] = defaultdict(list)
+    for hold in query.all():
+        holds_by_user[hold.user_id].append(hold)
+
+    summary = {"users": 0, "users_failed": 0, "users_skipped": 0, "checked": 0, "missing": 0, "unsupported": 0, "updated": 0}
+    if not holds_by_user:
+        return summary
+
+    users = db.query(User).filter(User.id.in_(list(holds_by_user.keys()))).all()
+    refreshable = []
+    for user in users:
+        if user.library_card_number and user.library_pin:
+            refreshable.append(user)
+        else:
+            summary["users_skipped"] += 1
+
+    semaphore = asyncio.Semaphore(HOLD_REFRESH_CONCURRENCY)
+
+    async def _refresh(user: User) -> Dict[str, Any]:
+        async with semaphore:
+            return await refresh_user_holds(user, holds_by_user[user.id], priority=priority)
+
+    results = await asyncio.gather(*(_refresh(user) for user in refreshable), return_exceptions=True)
+
+    now = datetime.utcnow()
+    status_updates: Dict[int, Dict[str, Any]] = {}
+    for user, result in zip(refreshable, results):
+        if isinstance(result, BaseException):
+            print(f"❌ Hold refresh failed for user {user.id}: {result}")
+            result = {"updates": {}, "matched": 0, "missing": 0, "unsupported": [],
+                      "failed": [hold.id for hold in holds_by_user[user.id]]}
+        failed = set(result["failed"])
+        unsupported = set(result["unsupported"])
+        if failed:
+            summary["users_failed"] += 1
+        else:
+            summary["users"] += 1
+        summary["checked"] += result["matched"]
+        summary["missing"] += result["missing"]
+        summary["unsupported"] += len(unsupported)
+        summary["updated"] += len(result["updates"])
+        retry_at = now + _jittered(timedelta(minutes=HOLD_REFRESH_RETRY_MINUTES))
+        for hold in holds_by_user[user.id]:
+            if hold.id in failed:
+                status_updates[hold.id] = {"next_check_at": retry_at}
+            elif hold.id in unsupported:
+                # Nothing to read; look again on the normal schedule rather than every tick
+                status_updates[hold.id] = {"next_check_at": next_check_time(hold.status, hold.queue_position, now)}
+            else:
+                update = result["updates"].get(hold.id, {})
+                status = update.get("status", hold.status)
+                queue_position = update.get("queue_position", hold.queue_position)
+                # The page was read, so every hold on it counts as checked now,
+                # including ones that weren't listed (otherwise they'd look stale forever)
+                status_updates[hold.id] = {
+                    "last_checked": now,
+                    **update,
+                    "next_check_at": next_check_time(status, queue_position, now),
+                }
+
+    book_service.update_holds_status_bulk(db, status_updates)
+    print(f"DEBUG: Hold refresh finished: {summary}")
+    return summary
+
+
+def _lease_key(user_id: int) -> str:
+    return f"hold-refresh:user:{user_id}"
+
+
+async def refresh_leased_holds(
+    db: Session,
+    user_ids: Optional[List[int]] = None,
+    max_users: Optional[int] = None,
+    priority: int = PRIORITY_BACKGROUND,
+) -> Dict[str, int]:
+    """
+    refresh_all_holds for the users this node manages to lease. Users another
+    node is already refreshing are left to it and counted in "users_leased_elsewhere".
+    """
+    if user_ids is None:
+        user_ids = [user_id for (user_id,) in
+                    db.query(Hold.user_id).filter(Hold.status.notin_(FINAL_STATUSES)).distinct().all()]
+    keys = [_lease_key(user_id) for user_id in user_ids]
+    token, claimed_keys = lease_service.claim(db, keys)
+    leased_elsewhere = len(keys) - len(claimed_keys)
+    if max_users is not None and len(claimed_keys) > max_users:
+        lease_service.release(db, token, claimed_keys[max_users:])
+        claimed_keys = claimed_keys[:max_users]
+    claimed = set(claimed_keys)
+    claimed_user_ids = [user_id for user_id, key in zip(user_ids, keys) if key in claimed]
+
+    try:
+        # A refresh of many users can outlast the lease TTL; keep the leases
+        # alive until the last one is done so no other node picks them up
+        async with lease_service.renewing(token, claimed_keys):
+            summary = await refresh_all_holds(db, claimed_user_ids, priority=priority)
+    finally:
+        # next_check_at has moved on, so the due query won't hand these users out again
+        lease_service.release(db, token, claimed_keys)
+    summary["users_leased_elsewhere"] = leased_elsewhere
+    return summary
+
+
+# --- On-Demand Refresh ---
+
+# One in-flight refresh per user, however many requests ask for it
+_user_refreshes: Dict[int, asyncio.Task] = {}
+_on_demand_stats = {"started": 0, "joined": 0}
+
+# Outcomes of wait_for_user_refresh
+REFRESH_FINISHED = "finished"
+REFRESH_TIMED_OUT = "timed_out"
+REFRESH_FAILED = "failed"
+# Someone else (the background scheduler or another node) holds the user's lease
+REFRESH_LEASED_ELSEWHERE = "leased_elsewhere"
+
+
+def holds_age_seconds(holds: List[Hold], now: Optional[datetime] = None) -> Optional[float]:
+    """Age of the stalest active hold, or None if there's nothing to refresh."""
+    now = now or datetime.utcnow()
+    checked = [
+        hold.last_checked or datetime.min for hold in holds
+        if hold.status not in FINAL_STATUSES and library_service.supports_hold_refresh(hold.library_name)
+    ]
+    if not checked:
+        return None
+    return (now - min(checked)).total_seconds()
+
+
+async def _refresh_user(user_id: int):
+    db = SessionLocal()
+    try:
+        return await refresh_leased_holds(db, [user_id], priority=PRIORITY_BATCH)
+    finally:
+        db.close()
+
+
+def start_user_refresh(user_id: int) -> asyncio.Task:
+    """Start a background refresh of one user's holds, or return the one already running."""
+    task = _user_refreshes.get(user_id)
+    if task is not None and not task.done():
+        _on_demand_stats["joined"] += 1
+        return task
+
+    task = asyncio.create_task(_refresh_user(user_id))
+    _user_refreshes[user_id] = task
+    _on_demand_stats["started"] += 1
+
+    def _finished(finished: asyncio.Task):
+        if _user_refreshes.get(user_id) is finished:
+            del _user_refreshes[user_id]
+        if not finished.cancelled() and finished.exception() is not None:
+            print(f"❌ On-demand hold refresh failed for user {user_id}: {finished.exception()}")
+
+    task.add_done_callback(_finished)
+    return task
+
+
+async def wait_for_user_refresh(user_id: int, timeout_seconds: float) -> str:
+    """
+    Start (or join) a refresh for the user and wait up to the deadline. Returns
+    one of the REFRESH_* outcomes; REFRESH_LEASED_ELSEWHERE means this node
+    didn't refresh anything because another refresh of the user is under way.
+    """
+    task = start_user_refresh(user_id)
+    try:
+        # Shielded so a client giving up doesn't cancel the refresh for everyone else
+        summary = await asyncio.wait_for(asyncio.shield(task), timeout_seconds)
+    except asyncio.TimeoutError:
+        return REFRESH_TIMED_OUT
+    except Exception:
+        # Already logged by the done callback; the caller gets the cached rows
+        return REFRESH_FAILED
+    if summary.get("users_leased_elsewhere"):
+        return REFRESH_LEASED_ELSEWHERE
+    if summary.get("users_failed"):
+        return REFRESH_FAILED
+    return REFRESH_FINISHED
+
+
+async def wait_for_fresh_holds(db: Session, user_id: int, max_staleness_seconds: float, timeout_seconds: float) -> Tuple[List[Hold], Optional[float], str]:
+    """
+    Refresh the user's holds (or wait for whoever already is) until they're no
+    older than max_staleness_seconds or the timeout passes. Returns the holds,
+    their age and the refresh outcome.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout_seconds
+    outcome = await wait_for_user_refresh(user_id, timeout_seconds)
+    while True:
+        db.expire_all()
+        holds = book_service.get_holds_by_user(db, user_id=user_id)
+        age = holds_age_seconds(holds)
+        if outcome != REFRESH_LEASED_ELSEWHERE or age is None or age <= max_staleness_seconds:
+            return holds, age, outcome
+        # The lease holder writes the rows when it's done; watch for them
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return holds, age, REFRESH_TIMED_OUT
+        await asyncio.sleep(min(HOLD_REFRESH_POLL_SECONDS, remaining))
+
+
+# --- Background Scheduler ---
+
+def due_user_ids(db: Session, limit: int, now: Optional[datetime] = None) -> List[int]:
+    """Users with at least one hold due for a check, most overdue first."""
+    now = now or datetime.utcnow()
+    rows = (
+        db.query(Hold.user_id, func.min(Hold.next_check_at))
+        .join(User, User.id == Hold.user_id)
+        .filter(
+            Hold.status.notin_(FINAL_STATUSES),
+            or_(Hold.next_check_at.is_(None), Hold.next_check_at <= now),
+            User.library_card_number.isnot(None),
+            User.library_pin.isnot(None),
+        )
+        .group_by(Hold.user_id)
+        # Never-checked holds (NULL) sort first
+        .order_by(func.min(Hold.next_check_at))
+        .limit(limit)
+        .all()
+    )
+    return [user_id for user_id, _ in rows]
+
+
+class HoldRefreshScheduler:
+    """Periodically refreshes the users whose holds are due, a few at a time."""
+
+    def __init__(self, tick_seconds: float = HOLD_REFRESH_TICK_SECONDS, users_per_tick: int = HOLD_REFRESH_USERS_PER_TICK):
+        self.tick_seconds = tick_seconds
+        self.users_per_tick = users_per_tick
+        self._task: Optional[asyncio.Task] = None
+        self.ticks = 0
+        self.users_refreshed = 0
+        self.users_failed = 0
+        self.last_run_at: Optional[datetime] = None
+
+    async def start(self):
+        if self._task is not None or not HOLD_REFRESH_ENABLED:
+            return
+        self._task = asyncio.create_task(self._loop())
+        print(f"DEBUG: Started hold refresh scheduler (every {self.tick_seconds:.0f} s, {self.users_per_tick} users per tick)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def run_due(self, db: Session) -> Optional[Dict[str, int]]:
+        """Refresh the most overdue users; None when nothing is due."""
+        # Look past this tick's quota so users leased by other nodes don't stall us
+        user_ids = due_user_ids(db, self.users_per_tick * 3)
+        if not user_ids:
+            return None
+        summary = await refresh_leased_holds(db, user_ids, max_users=self.users_per_tick)
+        self.users_refreshed += summary["users"]
+        self.users_failed += summary["users_failed"]
+        return summary
+
+    async def _loop(self):
+        while True:
+            db = SessionLocal()
+            try:
+                self.ticks += 1
+                self.last_run_at = datetime.utcnow()
+                await self.run_due(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Hold refresh tick failed: {e}")
+            finally:
+                db.close()
+            # Sleep a jittered tick so several replicas don't wake in lockstep
+            await asyncio.sleep(self.tick_seconds * random.uniform(0.9, 1.1))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": HOLD_REFRESH_ENABLED,
+            "running": self._task is not None,
+            "ticks": self.ticks,
+            "users_refreshed": self.users_refreshed,
+            "users_failed": self.users_failed,
+            "on_demand_in_flight": len(_user_refreshes),
+            "on_demand_started": _on_demand_stats["started"],
+            "on_demand_joined": _on_demand_stats["joined"],
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
+
+
+# Shared scheduler started in the app lifespan
+hold_refresh_scheduler = HoldRefreshScheduler()
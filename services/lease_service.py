@@ -0,0 +1,138 @@
+"""
+Database-backed work leases.
+
+When several replicas of the app run background work, each unit of work (for
+example "refresh this user's holds") is leased before it's done. A lease row
+records the owning node and an expiry; claiming is a conditional UPDATE (or an
+INSERT guarded by the primary key), so two nodes can never hold the same
+lease, and a lease left behind by a node that died simply expires and can be
+claimed by anyone. No broker needed - just the shared database.
+
+Each claim gets a token; renewing and releasing go by that token, so a task
+can only touch the leases it claimed itself. Work that may outlast the TTL
+runs inside renewing(), which keeps pushing the expiry out until it's done.
+"""
+import asyncio
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db.database import SessionLocal
+from db.models import WorkLease
+
+# --- Configuration ---
+NODE_ID = os.getenv("NODE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", "600"))
+# renewing() extends held leases this often (a fraction of the TTL)
+LEASE_RENEW_FRACTION = 1 / 3
+
+_stats = {"claimed": 0, "conflicts": 0, "renewed": 0, "released": 0}
+
+
+def claim(db: Session, keys: List[str], ttl_seconds: int = LEASE_TTL_SECONDS) -> Tuple[str, List[str]]:
+    """
+    Claim as many of ``keys`` as possible for this node. Returns the claim
+    token and the keys that were claimed, in the order given. Keys leased by
+    another live node (or another task on this one) are skipped.
+    """
+    token = uuid.uuid4().hex
+    if not keys:
+        return token, []
+    now = datetime.utcnow()
+    values = {
+        WorkLease.owner: NODE_ID,
+        WorkLease.claim_token: token,
+        WorkLease.expires_at: now + timedelta(seconds=ttl_seconds),
+        WorkLease.updated_at: now,
+    }
+
+    # Take over expired leases in one statement. Live leases are never re-claimed,
+    # not even our own, so two tasks on the same node don't double up either
+    (
+        db.query(WorkLease)
+        .filter(WorkLease.key.in_(keys), WorkLease.expires_at < now)
+        .update(values, synchronize_session=False)
+    )
+    db.commit()
+
+    # Keys nobody has leased yet; the primary key makes a racing insert fail
+    existing = {key for (key,) in db.query(WorkLease.key).filter(WorkLease.key.in_(keys)).all()}
+    for key in keys:
+        if key in existing:
+            continue
+        db.add(WorkLease(key=key, owner=NODE_ID, claim_token=token,
+                         expires_at=values[WorkLease.expires_at], updated_at=now))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+
+    claimed = {key for (key,) in db.query(WorkLease.key).filter(WorkLease.key.in_(keys), WorkLease.claim_token == token).all()}
+    _stats["claimed"] += len(claimed)
+    _stats["conflicts"] += len(keys) - len(claimed)
+    return token, [key for key in keys if key in claimed]
+
+
+def renew(db: Session, token: str, keys: List[str], ttl_seconds: int = LEASE_TTL_SECONDS) -> int:
+    """Push out the expiry of the leases on ``keys`` still held under ``token``."""
+    if not keys:
+        return 0
+    now = datetime.utcnow()
+    count = (
+        db.query(WorkLease)
+        .filter(WorkLease.key.in_(keys), WorkLease.claim_token == token)
+        .update({WorkLease.expires_at: now + timedelta(seconds=ttl_seconds), WorkLease.updated_at: now},
+                synchronize_session=False)
+    )
+    db.commit()
+    _stats["renewed"] += count
+    return count
+
+
+@asynccontextmanager
+async def renewing(token: str, keys: List[str], ttl_seconds: int = LEASE_TTL_SECONDS):
+    """Keep the leases claimed under ``token`` alive while the block runs."""
+    async def _renew_loop():
+        while True:
+            await asyncio.sleep(ttl_seconds * LEASE_RENEW_FRACTION)
+            db = SessionLocal()
+            try:
+                renew(db, token, keys, ttl_seconds)
+            except Exception as e:
+                print(f"❌ Could not renew {len(keys)} leases: {e}")
+            finally:
+                db.close()
+
+    task = asyncio.create_task(_renew_loop()) if keys else None
+    try:
+        yield
+    finally:
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+def release(db: Session, token: str, keys: List[str]) -> int:
+    """
+    Give up the leases on ``keys`` claimed under ``token`` so other nodes can
+    take them right away. A lease someone re-claimed after it expired is left alone.
+    """
+    if not keys:
+        return 0
+    count = (
+        db.query(WorkLease)
+        .filter(WorkLease.key.in_(keys), WorkLease.claim_token == token)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    _stats["released"] += count
+    return count
+
+
+def stats() -> Dict[str, Any]:
+    return {"node_id": NODE_ID, **_stats}
@@ -1,30 +1,148 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable, AsyncIterator
 from datetime import datetime
+import asyncio
+import contextvars
 import os
-from playwright.async_api import async_playwright, Playwright, Browser, Page, expect
-from schemas.schemas import BookSearchQuery, BookSearchResult, PlaceHoldRequest, Hold
-from db.models import Hold as HoldModel # Import to get access to the model's structure
+import re
+import time
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
+from schemas.schemas import BookSearchQuery, BookSearchResult, PlaceHoldRequest, Hold, FederatedSearchQuery, BatchHoldItem
+from services.browser_pool import browser_pool
+from services.session_cache import session_cache, _digest
+from services.search_cache import search_cache, make_key
+from services.resource_blocking import apply_resource_blocking
+from services import bibliocommons_http
+from services.single_flight import SingleFlight
+from services.selector_engine import selector_engine
+from services.deadline import ScrapeTimeoutError, Deadline, deadline_scope, budget_ms, budget_seconds, step, current as current_deadline
+from services import scrape_workers as scrape_workers_module
+from services.scrape_workers import scrape_workers, ScrapeWorkerError
+from services.browser_scheduler import browser_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from services.search_parsing import (
+    RESULT_ITEM_SELECTOR, TITLE_SELECTORS, GENERIC_TITLE_SELECTORS, AUTHOR_SELECTORS, AVAILABILITY_SELECTORS,
+    ISBN_SELECTOR, EXTRACT_RESULTS_JS, extract_args, split_by_format, count_physical,
+    take_physical, merge_results, dedupe_key, extract_item_id,
+)
 
 # --- Configuration ---
 LIBRARY_URLS = {
     "Contra Costa": {
         "login": "https://ccclib.bibliocommons.com/user/login",
         "search": "https://ccclib.bibliocommons.com/v2/search?query={query}&searchType=smart&f_FORMAT=BK|GRAPHIC_NOVEL|LPRINT|PICTURE_BOOK|BOARD_BK",
+        "holds": "https://ccclib.bibliocommons.com/v2/holds",
     },
     "Alameda": {
         "login": "https://alam1.aclibrary.org/patronaccount/login",
         # "search": "https://alam1.aclibrary.org/search/searchresults.aspx?ctx=1.1033.0.0.5&type=Keyword&term={query}&by=KW&sort=RELEVANCE&limit=TOM=t&query=&page=0&searchid=1",
         "search": "https://aclibrary.bibliocommons.com/v2/search?query={query}&searchType=smart&f_FORMAT=BK|GRAPHIC_NOVEL|LPRINT|PICTURE_BOOK|BOARD_BK",
+        "holds": "https://aclibrary.bibliocommons.com/v2/holds",
     }
 }
 
+# Libraries with a working login and holds page; holds anywhere else are
+# simulated on placement, so there is nothing to read back
+HOLDS_PAGE_LIBRARIES = ("Contra Costa",)
+
+# How search results are read from the page: "evaluate" pulls every result in a
+# single page.evaluate call, "handles" walks element handles one call at a time
+SEARCH_EXTRACTION_MODE = os.getenv("SEARCH_EXTRACTION_MODE", "evaluate")
+
+# Incremental parsing reads result items a batch at a time, classifying them as
+# they come, and stops scrolling and parsing once query.limit physical books are
+# in hand; otherwise every loaded item (up to the cap) is parsed and then trimmed
+SEARCH_INCREMENTAL_PARSING = os.getenv("SEARCH_INCREMENTAL_PARSING", "true").lower() not in ("0", "false", "no")
+SEARCH_PARSE_BATCH_SIZE = int(os.getenv("SEARCH_PARSE_BATCH_SIZE", "5"))
+SEARCH_MAX_ITEMS = 30 # Result items considered per search, at least
+SEARCH_MAX_LIMIT = 50
+
+# When the first results page doesn't hold enough physical books, pages
+# 2..SEARCH_MAX_PAGES are fetched concurrently (over HTTP, or in that many tabs)
+SEARCH_MAX_PAGES = int(os.getenv("SEARCH_MAX_PAGES", "3"))
+SEARCH_MAX_PAGES_LIMIT = 10
+SEARCH_PAGE_TABS = int(os.getenv("SEARCH_PAGE_TABS", "3"))
+
+# Overall time budgets for the public operations; every wait inside them is
+# clamped to what's left (see services/deadline.py)
+SEARCH_DEADLINE_SECONDS = float(os.getenv("SEARCH_DEADLINE_SECONDS", "45"))
+HOLD_DEADLINE_SECONDS = float(os.getenv("HOLD_DEADLINE_SECONDS", "60"))
+HOLD_BATCH_DEADLINE_SECONDS = float(os.getenv("HOLD_BATCH_DEADLINE_SECONDS", "180"))
+HOLD_READ_DEADLINE_SECONDS = float(os.getenv("HOLD_READ_DEADLINE_SECONDS", "90"))
+NAVIGATION_TIMEOUT_MS = 30000 # Playwright's default, used when there's no deadline
+
+# Upper bounds for condition-based waits (the old fixed sleeps)
+SCROLL_MAX_ROUNDS = 3
+SCROLL_WAIT_MS = 1000
+LOGIN_OUTCOME_WAIT_MS = 2000
+
+# Tabs used side by side in the logged-in context when placing a batch of holds
+HOLD_BATCH_TABS = int(os.getenv("HOLD_BATCH_TABS", "2"))
+
+# Markers that appear once a login attempt has either succeeded or failed
+LOGIN_OUTCOME_SELECTOR = ", ".join([
+    'a[href*="dashboard"]', '.user-display-name', '#user_menu',
+    '.account-menu', '.user-menu', '#accountMenu', 'a[href*="logout"]',
+    '.alert-danger', '.error-message', '.field-error',
+])
+
+HOLD_ITEM_SELECTOR = '[data-testid="hold-item"], .cp-holds-item, .cp-batch-actions-list-item'
+
+EXTRACT_HOLDS_JS = """
+(selector) => Array.from(document.querySelectorAll(selector)).map((item) => {
+    const link = item.querySelector('a[href*="/record/"], a[href*="/item/show/"]');
+    return {
+        href: link ? (link.getAttribute("href") || "") : "",
+        title: link ? (link.innerText || "") : "",
+        text: item.innerText || "",
+    };
+})
+"""
+
+RESULT_COUNT_GREW_JS = "([selector, count]) => document.querySelectorAll(selector).length > count"
+
+# Libraries on the same catalog host share one adaptive concurrency limit
+if browser_scheduler.controller is not None:
+    for _name, _urls in LIBRARY_URLS.items():
+        browser_scheduler.controller.register_library(_name, _urls["search"])
+
+# Coalesce identical concurrent work
+search_flight = SingleFlight("search")
+hold_status_flight = SingleFlight("hold status check")
+
+def _slot_wait() -> Optional[float]:
+    """How long to wait for a browser slot: the scheduler's limit, clamped to the deadline."""
+    if current_deadline() is None:
+        return None
+    return budget_seconds("wait for browser slot", browser_scheduler.max_wait_seconds)
+
 # --- Core Playwright Functions ---
 
+async def _wait_for_login_outcome(page: Page, timeout_ms: int = LOGIN_OUTCOME_WAIT_MS):
+    """
+    Return as soon as the login form navigates away or an account/error marker
+    renders, instead of sleeping for the full timeout.
+    """
+    timeout_ms = budget_ms("wait for login outcome", timeout_ms)
+    waiters = [
+        asyncio.create_task(page.wait_for_url(lambda url: '/user/login' not in url, timeout=timeout_ms)),
+        asyncio.create_task(page.wait_for_selector(LOGIN_OUTCOME_SELECTOR, timeout=timeout_ms)),
+    ]
+    done, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    for waiter in pending:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+
+async def _new_page(context, library_name: str) -> Page:
+    """Open a page with the library's resource blocking profile installed."""
+    page = await context.new_page()
+    await apply_resource_blocking(page, library_name)
+    return page
+
 async def _login_to_library(page: Page, library_name: str, card_number: str, pin: str):
     """Logs into the specified library using Playwright."""
     url = LIBRARY_URLS[library_name]["login"]
     print(f"Navigating to {library_name} login page: {url}")
-    await page.goto(url, wait_until="networkidle")
+    async with step("open login page"):
+        await page.goto(url, wait_until="networkidle", timeout=budget_ms("open login page", NAVIGATION_TIMEOUT_MS))
 
     if library_name == "Contra Costa":
         try:
@@ -41,15 +159,12 @@ async def _login_to_library(page: Page, library_name: str, card_number: str, pin
                 'input[type="text"]', '[placeholder*="card" i]', '[placeholder*="library" i]'
             ]
             
-            username_field = None
-            for selector in username_selectors:
-                try:
-                    username_field = await page.query_selector(selector)
-                    if username_field:
-                        print(f"Found username field with selector: {selector}")
-                        break
-                except:
-                    continue
+            found = await selector_engine.find(
+                page, library_name, "login_username", username_selectors, generic=['input[type="text"]']
+            )
+            username_field = found[1] if found else None
+            if found:
+                print(f"Found username field with selector: {found[0]}")
             
             if not username_field:
                 raise Exception("Could not find username/card number field on login page")
@@ -60,15 +175,12 @@ async def _login_to_library(page: Page, library_name: str, card_number: str, pin
                 'input[type="password"]', '[placeholder*="pin" i]'
             ]
             
-            pin_field = None
-            for selector in pin_selectors:
-                try:
-                    pin_field = await page.query_selector(selector)
-                    if pin_field:
-                        print(f"Found PIN field with selector: {selector}")
-                        break
-                except:
-                    continue
+            found = await selector_engine.find(
+                page, library_name, "login_pin", pin_selectors, generic=['input[type="password"]']
+            )
+            pin_field = found[1] if found else None
+            if found:
+                print(f"Found PIN field with selector: {found[0]}")
             
             if not pin_field:
                 raise Exception("Could not find PIN/password field on login page")
@@ -80,8 +192,14 @@ async def _login_to_library(page: Page, library_name: str, card_number: str, pin
             print(f"Filling in PIN: {pin[:2]}***")
             await pin_field.type(pin, delay=100)
             
-            # Wait a moment for any JavaScript validation
-            await page.wait_for_timeout(1000)
+            # Give any JavaScript validation a moment to enable the submit button
+            try:
+                await page.wait_for_selector(
+                    'input[type="submit"]:enabled, button[type="submit"]:enabled',
+                    timeout=budget_ms("wait for login button", 1000),
+                )
+            except PlaywrightTimeoutError:
+                pass
             
             # Click login button - try multiple selectors
             login_button_selectors = [
@@ -94,21 +212,26 @@ async def _login_to_library(page: Page, library_name: str, card_number: str, pin
                 '#login-button'
             ]
             
+            # One combined wait instead of a 2 s click attempt per selector
             login_clicked = False
-            for selector in login_button_selectors:
+            found = await selector_engine.find(
+                page, library_name, "login_button", login_button_selectors,
+                timeout_ms=budget_ms("find login button", 2000),
+            )
+            if found:
+                click_timeout = budget_ms("click login button", 2000)
                 try:
-                    await page.click(selector, timeout=2000)
-                    print(f"Clicked login button with selector: {selector}")
+                    await found[1].click(timeout=click_timeout)
+                    print(f"Clicked login button with selector: {found[0]}")
                     login_clicked = True
-                    break
-                except:
-                    continue
+                except Exception as e:
+                    print(f"DEBUG: Login button click failed: {e}")
             
             if not login_clicked:
                 raise Exception("Could not find or click login button")
             
-            # Wait for navigation after login
-            await page.wait_for_timeout(2000)
+            # Wait for navigation (or an account/error marker) after login
+            await _wait_for_login_outcome(page)
             
             # Take screenshot after login for debugging
             try:
@@ -186,6 +309,8 @@ async def _login_to_library(page: Page, library_name: str, card_number: str, pin
                 
             # Always proceed with hold placement unless there was a clear error
                     
+        except ScrapeTimeoutError:
+            raise
         except Exception as e:
             print(f"❌ Login error: {e}")
             # Take a screenshot for debugging
@@ -198,15 +323,301 @@ async def _login_to_library(page: Page, library_name: str, card_number: str, pin
             
     elif library_name == "Alameda":
         # Keep placeholder for Alameda
-        await page.fill("#barcode", card_number)
-        await page.fill("#pin", pin)
-        await page.click("text=Login")
+        async with step("fill login form"):
+            await page.fill("#barcode", card_number, timeout=budget_ms("fill login form", NAVIGATION_TIMEOUT_MS))
+            await page.fill("#pin", pin, timeout=budget_ms("fill login form", NAVIGATION_TIMEOUT_MS))
+            await page.click("text=Login", timeout=budget_ms("click login button", NAVIGATION_TIMEOUT_MS))
         
+        account_timeout = budget_ms("wait for login outcome", 3000)
         try:
-            await page.wait_for_selector("text=My Account", timeout=3000)
+            await page.wait_for_selector("text=My Account", timeout=account_timeout)
         except Exception:
             raise Exception(f"Login failed for {library_name}. Check credentials and selectors.")
 
+async def _session_is_live(page: Page, library_name: str) -> bool:
+    """
+    Cheap check that restored cookies are still accepted: BiblioCommons
+    redirects the holds page to the login form when the session is gone.
+    """
+    holds_url = LIBRARY_URLS[library_name].get("holds")
+    if not holds_url:
+        return False
+    navigation_timeout = budget_ms("validate cached session", NAVIGATION_TIMEOUT_MS)
+    try:
+        await page.goto(holds_url, wait_until="domcontentloaded", timeout=navigation_timeout)
+    except Exception as e:
+        print(f"DEBUG: Session validation failed to load holds page: {e}")
+        return False
+    return '/user/login' not in page.url
+
+async def _ensure_logged_in(page: Page, library_name: str, card_number: str, pin: str, restored: bool):
+    """
+    Reuse a restored session when the library still accepts it, otherwise log in
+    from scratch and cache the new session for the next call.
+    """
+    if restored:
+        if await _session_is_live(page, library_name):
+            print(f"DEBUG: Reusing cached session for {library_name}")
+            return
+        print(f"DEBUG: Cached session for {library_name} was rejected, logging in again")
+        session_cache.invalidate(library_name, card_number)
+        await page.context.clear_cookies()
+
+    await _login_to_library(page, library_name, card_number, pin)
+    session_cache.set(library_name, card_number, pin, await page.context.storage_state())
+
+async def _extract_records_with_handles(page: Page, limit: int = 30, start: int = 0) -> List[Dict[str, Any]]:
+    """
+    Build raw result records through individual element handles. Slower than
+    EXTRACT_RESULTS_JS but useful when debugging selectors.
+    """
+    records = []
+    search_items = await page.query_selector_all(RESULT_ITEM_SELECTOR)
+    print(f"DEBUG: Found {len(search_items)} search result items")
+    
+    for i, item in enumerate(search_items[start:start + limit], start=start):
+        try:
+            title_text, title_href = "", ""
+            for selector in TITLE_SELECTORS:
+                title_element = await item.query_selector(selector)
+                if title_element:
+                    text = await title_element.inner_text()
+                    if text and text.strip():
+                        title_text = text.strip()
+                        title_href = await title_element.get_attribute('href') or ""
+                        break
+            
+            author, availability = "", ""
+            for selector in AUTHOR_SELECTORS:
+                author_element = await item.query_selector(selector)
+                if author_element:
+                    author = await author_element.inner_text()
+                    break
+            for selector in AVAILABILITY_SELECTORS:
+                availability_element = await item.query_selector(selector)
+                if availability_element:
+                    availability = await availability_element.inner_text()
+                    break
+            
+            isbn_element = await item.query_selector(ISBN_SELECTOR)
+            records.append({
+                "title_text": title_text,
+                "title_href": title_href,
+                "item_text": await item.inner_text(),
+                "author": author,
+                "availability": availability,
+                "isbn_text": await isbn_element.inner_text() if isbn_element else "",
+            })
+        except Exception as e:
+            print(f"Error reading search result item {i+1}: {e}")
+            continue
+    return records
+
+def _record_title_selectors(library_name: str, records: List[Dict[str, Any]]):
+    """Feed which title selector matched each extracted result into the selector stats."""
+    counts: Dict[str, int] = {}
+    for record in records:
+        selector = record.get("title_selector")
+        if selector:
+            counts[selector] = counts.get(selector, 0) + 1
+    for selector, count in counts.items():
+        selector_engine.record_win(library_name, "result_title", selector, TITLE_SELECTORS, count=count)
+
+async def _load_more_results(page: Page, wanted_physical: int, max_items: int = 30):
+    """
+    Scroll for lazily loaded results until enough physical books are on the
+    page or the result count stops growing, at most SCROLL_MAX_ROUNDS times.
+    """
+    for _ in range(SCROLL_MAX_ROUNDS):
+        records = await page.evaluate(EXTRACT_RESULTS_JS, extract_args(limit=max_items))
+        if len(records) >= max_items or count_physical(records) >= wanted_physical:
+            print(f"DEBUG: {len(records)} results loaded, no more scrolling needed")
+            return
+        
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            await page.wait_for_function(
+                RESULT_COUNT_GREW_JS, arg=[RESULT_ITEM_SELECTOR, len(records)],
+                timeout=budget_ms("scroll for more results", SCROLL_WAIT_MS),
+            )
+        except PlaywrightTimeoutError:
+            print(f"DEBUG: Result count stopped growing at {len(records)}")
+            return
+
+async def _extract_records(page: Page, library_name: str, start: int, limit: int) -> List[Dict[str, Any]]:
+    """Read raw records for result items ``start`` .. ``start + limit`` with the configured extraction mode."""
+    if SEARCH_EXTRACTION_MODE == "handles":
+        return await _extract_records_with_handles(page, limit=limit, start=start)
+    # One page.evaluate round trip instead of a dozen CDP calls per item,
+    # trying the title selectors that worked before first
+    title_selectors = selector_engine.ordered(library_name, "result_title", TITLE_SELECTORS, GENERIC_TITLE_SELECTORS)
+    records = await page.evaluate(EXTRACT_RESULTS_JS, extract_args(start=start, limit=limit, title_selectors=title_selectors))
+    _record_title_selectors(library_name, records)
+    return records
+
+async def _collect_records(page: Page, library_name: str, wanted: int, max_items: int, emit: bool = True) -> List[Dict[str, Any]]:
+    """
+    Incrementally read result items in page order, a batch at a time, until
+    ``wanted`` physical books have been seen. Only scrolls for lazily loaded
+    results when the items on the page run out first, and never parses an item
+    past the last one needed. ``emit`` streams the physical books as they're found.
+    """
+    records: List[Dict[str, Any]] = []
+    found = 0
+    batch_size = max(SEARCH_PARSE_BATCH_SIZE, 1)
+    for scroll_round in range(SCROLL_MAX_ROUNDS + 1):
+        while len(records) < max_items:
+            batch = await _extract_records(page, library_name, len(records), min(batch_size, max_items - len(records)))
+            if not batch:
+                break
+            batch, found = take_physical(batch, wanted, found)
+            if emit:
+                _emit_records(batch, library_name, start=len(records))
+            records.extend(batch)
+            if found >= wanted:
+                print(f"DEBUG: Found {found} physical books in the first {len(records)} results, stopping")
+                return records
+        
+        if len(records) >= max_items or scroll_round == SCROLL_MAX_ROUNDS:
+            break
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            await page.wait_for_function(
+                RESULT_COUNT_GREW_JS, arg=[RESULT_ITEM_SELECTOR, len(records)],
+                timeout=budget_ms("scroll for more results", SCROLL_WAIT_MS),
+            )
+        except PlaywrightTimeoutError:
+            print(f"DEBUG: Result count stopped growing at {len(records)}")
+            break
+    return records
+
+def _search_limits(query: BookSearchQuery) -> Tuple[int, int]:
+    """(physical books wanted, result items to consider at most) for a query."""
+    wanted = max(1, min(query.limit, SEARCH_MAX_LIMIT))
+    return wanted, max(SEARCH_MAX_ITEMS, wanted * 6)
+
+def _search_pages(query: BookSearchQuery) -> int:
+    """How many result pages a query may look at."""
+    max_pages = query.max_pages if query.max_pages is not None else SEARCH_MAX_PAGES
+    return max(1, min(max_pages, SEARCH_MAX_PAGES_LIMIT))
+
+def _search_url(library_name: str, query: BookSearchQuery, page_number: int = 1) -> str:
+    """Search URL for a library, using the configured URL which includes format filters."""
+    search_term = query.query.replace(" ", "%20")
+    url = LIBRARY_URLS[library_name]["search"].format(query=search_term)
+    if page_number > 1:
+        url += f"&page={page_number}"
+    return url
+
+async def _search_more_pages(
+    fetch_page: Callable[[int], Awaitable[Optional[List[Dict[str, Any]]]]],
+    max_pages: int,
+    wanted: int,
+    found: int,
+) -> List[Dict[str, Any]]:
+    """
+    Fetch result pages 2..max_pages concurrently and fold them together in page
+    order until ``wanted`` physical books have been seen (``found`` were already
+    on page 1); pages still in flight at that point are cancelled. An empty or
+    failed page ends the results. Returns the raw records from the extra pages,
+    trimmed after the last physical book needed.
+    """
+    tasks = {page_number: asyncio.create_task(fetch_page(page_number)) for page_number in range(2, max_pages + 1)}
+    records: List[Dict[str, Any]] = []
+    next_page = 2
+    try:
+        # Fold pages in order; the later ones keep loading while we wait on earlier ones
+        while next_page in tasks and found < wanted:
+            page_records = None
+            try:
+                page_records = await tasks[next_page]
+            except Exception as e:
+                print(f"DEBUG: Results page {next_page} failed: {e}")
+            if not page_records:
+                print(f"DEBUG: No results on page {next_page}, stopping")
+                break
+            page_records, found = take_physical(page_records, wanted, found)
+            records.extend(page_records)
+            print(f"DEBUG: Results page {next_page}: {len(page_records)} items, {found}/{wanted} physical books so far")
+            next_page += 1
+    finally:
+        # Stop condition met (or we're being cancelled): drop the pages still loading
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+    return records
+
+async def _search_more_pages_in_browser(
+    context,
+    library_name: str,
+    query: BookSearchQuery,
+    wanted: int,
+    found: int,
+    max_items: int,
+) -> List[Dict[str, Any]]:
+    """Search result pages 2..N in side-by-side tabs of the same context (see _search_more_pages)."""
+    tabs = asyncio.Semaphore(max(1, SEARCH_PAGE_TABS))
+    
+    async def _fetch_page(page_number: int) -> List[Dict[str, Any]]:
+        async with tabs:
+            tab = await _new_page(context, library_name)
+            try:
+                step_name = f"open results page {page_number}"
+                async with step(step_name):
+                    await tab.goto(
+                        _search_url(library_name, query, page_number),
+                        wait_until="domcontentloaded", timeout=budget_ms(step_name, NAVIGATION_TIMEOUT_MS),
+                    )
+                try:
+                    await tab.wait_for_selector(RESULT_ITEM_SELECTOR, timeout=budget_ms("wait for result items", 10000))
+                except PlaywrightTimeoutError:
+                    return []
+                # Each page only needs to cover what's still missing after page 1
+                return await _collect_records(tab, library_name, wanted - found, max_items, emit=False)
+            finally:
+                await tab.close()
+    
+    return await _search_more_pages(_fetch_page, _search_pages(query), wanted, found)
+
+async def _search_via_http(query: BookSearchQuery) -> Optional[List[BookSearchResult]]:
+    """
+    Browserless search for BiblioCommons catalogs. Returns None when the
+    response can't be used, so the caller falls back to Playwright.
+    """
+    library_name = query.library
+    if library_name not in LIBRARY_URLS:
+        return None
+    url = _search_url(library_name, query)
+    if not bibliocommons_http.is_bibliocommons_url(url):
+        return None
+    
+    print(f"DEBUG: HTTP search URL: {url}")
+    wanted, max_items = _search_limits(query)
+    timeout = budget_seconds("fetch search page", bibliocommons_http.HTTP_SEARCH_TIMEOUT_SECONDS)
+    records = await bibliocommons_http.fetch_search_records(url, limit=max_items, timeout=timeout)
+    if records is None:
+        return None
+    
+    records, found = take_physical(records, wanted) if SEARCH_INCREMENTAL_PARSING else (records, count_physical(records))
+    searched_more = False
+    if records and found < wanted and _search_pages(query) > 1:
+        async def _fetch_page(page_number: int) -> Optional[List[Dict[str, Any]]]:
+            page_timeout = budget_seconds("fetch search page", bibliocommons_http.HTTP_SEARCH_TIMEOUT_SECONDS)
+            return await bibliocommons_http.fetch_search_records(
+                _search_url(library_name, query, page_number), limit=max_items, timeout=page_timeout
+            )
+        more = await _search_more_pages(_fetch_page, _search_pages(query), wanted, found)
+        searched_more = bool(more)
+        records = records + more
+    
+    physical_books, ebooks = split_by_format(records, library_name)
+    if records and not physical_books and not searched_more:
+        # The browser can scroll for lazily loaded results, so let it try
+        print(f"DEBUG: No physical books found over HTTP. Found {len(ebooks)} non-books.")
+        return None
+    return physical_books[:wanted]
+
 async def _search_and_find_item(page: Page, library_name: str, query: BookSearchQuery) -> List[BookSearchResult]:
     """
     Performs a search and extracts the item ID and availability.
@@ -216,13 +627,14 @@ async def _search_and_find_item(page: Page, library_name: str, query: BookSearch
     
     if library_name == "Contra Costa":
         # Construct search URL for Contra Costa Library
-        search_term = query.query.replace(" ", "%20")
-        # Use the configured URL which includes format filters
-        url = LIBRARY_URLS[library_name]["search"].format(query=search_term)
+        url = _search_url(library_name, query)
         
         print(f"DEBUG: Searching Contra Costa Library for: '{query.query}'")
         print(f"DEBUG: Search URL: {url}")
-        await page.goto(url, wait_until="networkidle")
+        wanted, max_items = _search_limits(query)
+        
+        async with step("open search page"):
+            await page.goto(url, wait_until="networkidle", timeout=budget_ms("open search page", NAVIGATION_TIMEOUT_MS))
         
         # Take a screenshot for debugging
         try:
@@ -243,17 +655,14 @@ async def _search_and_find_item(page: Page, library_name: str, query: BookSearch
             '.searchResult'
         ]
         
-        results_found = False
-        for selector in search_result_selectors:
-            try:
-                print(f"DEBUG: Trying selector: {selector}")
-                await page.wait_for_selector(selector, timeout=5000)
-                print(f"DEBUG: Found results with selector: {selector}")
-                results_found = True
-                break
-            except:
-                print(f"DEBUG: Selector {selector} not found")
-                continue
+        # Race all the candidates in one wait instead of 5 s per selector
+        found = await selector_engine.find(
+            page, library_name, "search_results", search_result_selectors,
+            timeout_ms=budget_ms("wait for search results", 5000),
+        )
+        results_found = found is not None
+        if found:
+            print(f"DEBUG: Found results with selector: {found[0]}")
         
         if not results_found:
             # Check if there's a "no results" message
@@ -279,203 +688,35 @@ async def _search_and_find_item(page: Page, library_name: str, query: BookSearch
             return []
         
         # Wait for results to load
+        results_timeout = budget_ms("wait for result items", 10000)
         try:
-            await page.wait_for_selector('.cp-search-result-item-content', timeout=10000)
-        except:
+            await page.wait_for_selector('.cp-search-result-item-content', timeout=results_timeout)
+        except PlaywrightTimeoutError:
             print("DEBUG: No search results found (selector timeout)")
             return []
         
-        # Scroll down to load more results (BiblioCommons uses lazy loading)
-        for _ in range(3):
-            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            await page.wait_for_timeout(1000)
+        if SEARCH_INCREMENTAL_PARSING:
+            # Parse as items appear and stop as soon as enough physical books are found
+            records = await _collect_records(page, library_name, wanted, max_items)
+        else:
+            # Scroll down to load more results (BiblioCommons uses lazy loading)
+            await _load_more_results(page, wanted_physical=wanted, max_items=max_items)
+            records = await _extract_records(page, library_name, 0, max_items)
+        print(f"DEBUG: Extracted {len(records)} search result items")
         
-        # Extract search results using the working selector
-        search_items = await page.query_selector_all('.cp-search-result-item-content')
-        print(f"DEBUG: Found {len(search_items)} search result items")
+        # Not enough physical books on page 1: look at the next pages side by side
+        found = count_physical(records)
+        if found < wanted and _search_pages(query) > 1:
+            more = await _search_more_pages_in_browser(page.context, library_name, query, wanted, found, max_items)
+            _emit_records(more, library_name, start=len(records))
+            records += more
         
         # Separate physical books and ebooks
-        physical_books = []
-        ebooks = []
-        
-        for i, item in enumerate(search_items[:30]):  # Check more results to find physical books
-            try:
-                print(f"DEBUG: Processing search result {i+1}")
-                
-                # Extract title - try multiple selectors
-                title_selectors = [
-                    'h2 a', '.title-content a', '[data-testid="bib-title"] a', 
-                    '.cp-search-result-item-title a', '.title a', 'a.title-link',
-                    'h3 a', '.cp-bib-list-item-title a', '.listItemTitle a',
-                    'a[href*="/item/show/"]', '.title', 'h2', 'h3'
-                ]
-                title_element = None
-                title = "Unknown Title"
-                full_title_text = "Unknown Title"
-                
-                for selector in title_selectors:
-                    title_element = await item.query_selector(selector)
-                    if title_element:
-                        title_text = await title_element.inner_text()
-                        if title_text and title_text.strip():
-                            full_title_text = title_text.strip()
-                            title = full_title_text
-                            # If title has multiple lines, take the first one for the clean title
-                            if '\n' in title:
-                                title = title.split('\n')[0].strip()
-                            print(f"DEBUG: Found title '{title}' (Full: '{full_title_text}') with selector: {selector}")
-                            break
-                
-                # If still no title, try getting any text content from the item
-                if title == "Unknown Title":
-                    all_text = await item.inner_text()
-                    lines = all_text.split('\n')
-                    for line in lines:
-                        line = line.strip()
-                        if line and len(line) > 5 and 'by ' not in line.lower():
-                            title = line
-                            full_title_text = title
-                            print(f"DEBUG: Found title from text content: {title}")
-                            break
-                
-                print(f"DEBUG: Extracted title: {title}")
-                
-                # Check if this is a non-book format (ebook, audiobook, etc.)
-                # We want to prioritize physical print books
-                non_book_keywords = [
-                    'ebook', 'e-book', 'digital', 'downloadable', 'online', 
-                    'audiobook', 'audio book', 'sound recording', 'playaway',
-                    'hoopla', 'overdrive', 'streaming', 'electronic resource',
-                    'compact disc', 'spoken word'
-                ]
-                
-                # Check full title text for format info
-                is_non_book = any(keyword in full_title_text.lower() for keyword in non_book_keywords)
-                
-                # Also check availability and format info for digital/audio formats
-                item_text = await item.inner_text()
-                # print(f"DEBUG: Item text start: {item_text[:100].replace(chr(10), ' ')}...") 
-                
-                if not is_non_book:
-                    item_text_lower = item_text.lower()
-                    # Check for specific format indicators to avoid false positives (e.g. "Also available as eBook")
-                    if "format: ebook" in item_text_lower:
-                        is_non_book = True
-                    elif "format: downloadable" in item_text_lower:
-                        is_non_book = True
-                    elif "format: audiobook" in item_text_lower:
-                        is_non_book = True
-                    elif "format: cd" in item_text_lower:
-                        is_non_book = True
-                    elif "format: sound recording" in item_text_lower:
-                        is_non_book = True
-                    # Strong keywords that usually indicate non-book format
-                    elif "downloadable music" in item_text_lower:
-                        is_non_book = True
-                    elif "streaming video" in item_text_lower:
-                        is_non_book = True
-                    elif "electronic resource" in item_text_lower:
-                        is_non_book = True
-                
-                # Explicitly check for physical book formats to override false positives
-                # (e.g. if "Format: Book" is present, it's a book even if "eBook" is mentioned elsewhere)
-                if "format: book" in item_text_lower or "format: hardcover" in item_text_lower or "format: paperback" in item_text_lower or "format: large print" in item_text_lower:
-                    is_non_book = False
-                
-                # Extract author
-                author_selectors = [
-                    '.author-link', '.author', '[data-testid="bib-author"]',
-                    '.cp-search-result-item-author', '.subtitle'
-                ]
-                author_element = None
-                for selector in author_selectors:
-                    author_element = await item.query_selector(selector)
-                    if author_element:
-                        print(f"DEBUG: Found author with selector: {selector}")
-                        break
-                
-                author = await author_element.inner_text() if author_element else "Unknown Author"
-                author = author.replace("by ", "").strip()
-                print(f"DEBUG: Extracted author: {author}")
-                
-                # Extract library item ID from the link
-                href = await title_element.get_attribute('href') if title_element else ""
-                print(f"DEBUG: Extracted href: {href}")
-                
-                # Extract item ID from URL - try multiple patterns
-                import re
-                # Try various URL patterns for BiblioCommons
-                patterns = [
-                    r'/item/show/(\d+)',           # Original pattern
-                    r'/v2/record/(\w+)',           # BiblioCommons v2 pattern  
-                    r'/record/(\w+)',              # Alternative record pattern
-                    r'item_id=(\d+)',              # Query parameter
-                    r'/(\d+)$',                    # ID at end of URL
-                ]
-                
-                library_item_id = None
-                for pattern in patterns:
-                    item_id_match = re.search(pattern, href)
-                    if item_id_match:
-                        library_item_id = item_id_match.group(1)
-                        print(f"DEBUG: Found item ID '{library_item_id}' using pattern '{pattern}'")
-                        break
-                
-                if not library_item_id:
-                    library_item_id = f"unknown_{i+1}"
-                    print(f"DEBUG: No pattern matched, using fallback ID: {library_item_id}")
-                    
-                print(f"DEBUG: Final item ID: {library_item_id}")
-                
-                # Extract availability information
-                availability_selectors = [
-                    '.availability-line', '.item-availability', '[data-testid="availability"]',
-                    '.cp-availability', '.status'
-                ]
-                availability_element = None
-                for selector in availability_selectors:
-                    availability_element = await item.query_selector(selector)
-                    if availability_element:
-                        print(f"DEBUG: Found availability with selector: {selector}")
-                        break
-                
-                availability = await availability_element.inner_text() if availability_element else "Unknown availability"
-                print(f"DEBUG: Extracted availability: {availability}")
-                
-                # Try to extract ISBN if available
-                isbn_element = await item.query_selector('.isbn, .identifier')
-                isbn = await isbn_element.inner_text() if isbn_element else None
-                if isbn:
-                    isbn_match = re.search(r'(\d{10}|\d{13})', isbn)
-                    isbn = isbn_match.group(1) if isbn_match else None
-                
-                # Clean up title to remove format indicators
-                clean_title = title.replace(", eBook", "").replace(", eAudiobook", "").strip()
-                
-                result = BookSearchResult(
-                    title=clean_title,
-                    author=author.strip(),
-                    isbn=isbn,
-                    library_item_id=library_item_id,
-                    library_name="Contra Costa",
-                    availability=availability.strip()
-                )
-                
-                # Categorize results
-                if is_non_book:
-                    ebooks.append(result)
-                    print(f"Found non-book format: {clean_title} by {author} (ID: {library_item_id})")
-                else:
-                    physical_books.append(result)
-                    print(f"Found physical book: {clean_title} by {author} (ID: {library_item_id})")
-                
-            except Exception as e:
-                print(f"Error parsing search result item: {e}")
-                continue
+        physical_books, ebooks = split_by_format(records, library_name)
         
         # Prioritize physical books
         if physical_books:
-            results = physical_books[:5]  # Limit to first 5 physical books
+            results = physical_books[:wanted]  # Limit to the requested number of physical books
             print(f"DEBUG: Returning {len(results)} physical books")
         else:
             print(f"DEBUG: No physical books found. Found {len(ebooks)} non-books.")
@@ -505,12 +746,10 @@ async def _place_hold_on_item(page: Page, library_name: str, item_id: str) -> Di
         # Navigate to the specific item page using the v2 record format
         item_url = f"https://ccclib.bibliocommons.com/v2/record/{item_id}"
         print(f"Navigating to item page: {item_url}")
-        await page.goto(item_url, wait_until="networkidle")
+        async with step("open item page"):
+            await page.goto(item_url, wait_until="networkidle", timeout=budget_ms("open item page", NAVIGATION_TIMEOUT_MS))
         
         try:
-            # Wait for the page to load with multiple possible selectors
-            await page.wait_for_load_state('networkidle', timeout=15000)
-            
             # Take a screenshot for debugging
             try:
                 await page.screenshot(path=f"png_screenshots/item_page_{item_id}.png")
@@ -520,21 +759,20 @@ async def _place_hold_on_item(page: Page, library_name: str, item_id: str) -> Di
             page_title = await page.title()
             print(f"DEBUG: Item page loaded - Title: {page_title}")
             
-            # Try to wait for any content that indicates the page loaded
+            # Try to wait for any content that indicates the page loaded (one combined
+            # selector, so the first match wins instead of probing each for 3 s)
             content_selectors = [
                 '.bib-item-detail', '.item-detail', '.cp-bib-item', 
                 'h1', '.title', '.item-title', '.book-title', 'main', '.content'
             ]
             
             page_loaded = False
-            for selector in content_selectors:
-                try:
-                    await page.wait_for_selector(selector, timeout=3000)
-                    print(f"DEBUG: Found page content with selector: {selector}")
-                    page_loaded = True
-                    break
-                except:
-                    continue
+            try:
+                await page.wait_for_selector(", ".join(content_selectors), timeout=budget_ms("wait for item page content", 3000))
+                print("DEBUG: Found page content")
+                page_loaded = True
+            except PlaywrightTimeoutError:
+                pass
             
             if not page_loaded:
                 print("DEBUG: Page content selectors not found, proceeding anyway")
@@ -546,30 +784,36 @@ async def _place_hold_on_item(page: Page, library_name: str, item_id: str) -> Di
                 'button[title*="Hold"]', 'a[title*="Hold"]', 'input[type="submit"][value*="Hold"]'
             ]
             
-            hold_button = None
-            for selector in hold_button_selectors:
-                try:
-                    hold_button = await page.query_selector(selector)
-                    if hold_button:
-                        print(f"DEBUG: Found hold button with selector: {selector}")
-                        break
-                except:
-                    continue
+            # Bare "Hold" text also matches links like "My Holds"
+            found = await selector_engine.find(
+                page, library_name, "hold_button", hold_button_selectors,
+                generic=['button:has-text("Hold")', 'a:has-text("Hold")'],
+            )
+            hold_button = found[1] if found else None
+            if found:
+                print(f"DEBUG: Found hold button with selector: {found[0]}")
             
             if hold_button:
                 print("Clicking 'Place Hold' button")
-                await hold_button.click()
+                async with step("click hold button"):
+                    await hold_button.click(timeout=budget_ms("click hold button", NAVIGATION_TIMEOUT_MS))
                 
                 # Wait for hold confirmation or hold form
+                confirmation_timeout = budget_ms("wait for hold confirmation", 5000)
                 try:
-                    await page.wait_for_selector('.hold-confirmation, .hold-success, .cp-cancel-hold-button, form[action*="hold"]', timeout=5000)
+                    await page.wait_for_selector('.hold-confirmation, .hold-success, .cp-cancel-hold-button, form[action*="hold"]', timeout=confirmation_timeout)
                     
                     # If there's a form, try to submit it
                     submit_button = await page.query_selector('button:has-text("Submit"), input[type="submit"]')
                     if submit_button:
                         print("Submitting hold request")
-                        await submit_button.click()
-                        await page.wait_for_selector('.hold-confirmation, .hold-success, .alert-success', timeout=5000)
+                        # Out of budget here means the hold was most likely placed, so
+                        # the default values below are still the best answer
+                        await submit_button.click(timeout=budget_ms("submit hold form", 5000))
+                        await page.wait_for_selector(
+                            '.hold-confirmation, .hold-success, .alert-success',
+                            timeout=budget_ms("wait for hold confirmation", 5000),
+                        )
                     
                     # Extract hold information if available
                     queue_element = await page.query_selector('text=/queue position/i, text=/position.*in.*queue/i')
@@ -614,6 +858,8 @@ async def _place_hold_on_item(page: Page, library_name: str, item_id: str) -> Di
                 else:
                     raise Exception("Could not find 'Place Hold' button on item page")
                     
+        except ScrapeTimeoutError:
+            raise
         except Exception as e:
             print(f"❌ Error placing hold: {e}")
             try:
@@ -631,98 +877,387 @@ async def _place_hold_on_item(page: Page, library_name: str, item_id: str) -> Di
             "last_checked": datetime.utcnow(),
         }
 
-async def _check_hold_status_on_page(page: Page, library_name: str, hold: HoldModel) -> Dict[str, Any]:
+async def _read_holds_page(page: Page, library_name: str) -> Optional[List[Dict[str, Any]]]:
     """
-    Navigates to the 'My Holds' page and extracts the status for the tracked item.
+    Open the 'My Holds' page (unless the page is already on it) and parse the
+    rendered holds list in one page.evaluate call. None if the page has no
+    holds URL configured or no holds list showed up.
     """
-    # Navigate to the holds page
-    # NOTE: This URL is a placeholder and MUST be updated.
-    if library_name == "Contra Costa":
-        await page.goto("https://ccclib.bibliocommons.com/v2/holds")
-    elif library_name == "Alameda":
-        await page.goto("https://aclibrary.bibliocommons.com/v2/holds")
-        
-    # Placeholder for finding the hold item in the list and extracting status
-    # This is highly complex and requires specific parsing logic from the user.
-    print(f"Simulating status check for {hold.title} ({hold.library_item_id}) on {library_name} holds page.")
+    holds_url = LIBRARY_URLS.get(library_name, {}).get("holds")
+    if not holds_url:
+        return None
     
-    # *** SIMULATION: Return an updated status ***
-    if hold.queue_position > 1:
-        new_position = hold.queue_position - 1
-        new_days = hold.estimated_wait_days - 1
-        new_status = "In Transit" if new_position < 5 else "Pending"
-    else:
-        new_position = 0
-        new_days = 0
-        new_status = "Ready for Pickup"
+    if not page.url.startswith(holds_url):
+        async with step("open holds page"):
+            await page.goto(holds_url, wait_until="domcontentloaded", timeout=budget_ms("open holds page", NAVIGATION_TIMEOUT_MS))
+    
+    items_timeout = budget_ms("wait for hold items", 5000)
+    try:
+        await page.wait_for_selector(HOLD_ITEM_SELECTOR, timeout=items_timeout)
+    except PlaywrightTimeoutError:
+        print("DEBUG: No hold items found on holds page")
+        return None
+    
+    raw_items = await page.evaluate(EXTRACT_HOLDS_JS, HOLD_ITEM_SELECTOR)
+    records = []
+    for raw in raw_items:
+        item_id = extract_item_id(raw["href"])
+        if not item_id:
+            continue
+        text = raw["text"].lower()
+        position_match = re.search(r'#\s*(\d+)|position[^\d]*(\d+)', text)
+        queue_position = int(next(g for g in position_match.groups() if g)) if position_match else None
+        if "ready for pickup" in text or "ready for pick up" in text:
+            hold_status = "Ready for Pickup"
+        elif "in transit" in text:
+            hold_status = "In Transit"
+        elif "suspended" in text or "paused" in text:
+            hold_status = "Suspended"
+        else:
+            hold_status = "Pending"
+        records.append({
+            "library_item_id": item_id,
+            "title": raw["title"].strip() or None,
+            "status": hold_status,
+            "queue_position": queue_position,
+        })
+    return records
 
+def hold_record_to_status(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a parsed hold record into the fields stored on the Hold row."""
+    queue_position = record.get("queue_position")
+    if record["status"] in ("Ready for Pickup", "In Transit"):
+        queue_position = 0 if queue_position is None else queue_position
     return {
-        "status": new_status,
-        "queue_position": new_position,
-        "estimated_wait_days": new_days,
+        "status": record["status"],
+        "queue_position": queue_position,
+        "estimated_wait_days": queue_position * 3 if queue_position is not None else None,  # Rough estimate
         "last_checked": datetime.utcnow(),
     }
 
 # --- Public Service Functions ---
 
-async def search_library_catalog(query: BookSearchQuery) -> List[BookSearchResult]:
-    """Public function to search the library catalog."""
-    print(f"DEBUG: Received search query: '{query.query}' for library '{query.library}' with search_type '{query.search_type}'")
-    async with async_playwright() as p:
-        browser: Browser = await p.chromium.launch(
-            headless=True,
-            args=[
-                '--no-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-blink-features=AutomationControlled',  # Hide automation
-                '--disable-features=IsolateOrigins,site-per-process'
-            ]
-        )
-        # Create context with realistic viewport and user agent
-        context = await browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
-        page: Page = await browser.new_page()
+async def _scrape_catalog(query: BookSearchQuery, priority: int = PRIORITY_INTERACTIVE) -> List[BookSearchResult]:
+    """Run a live catalog search, in a scrape worker process when they're running."""
+    if scrape_workers.enabled:
         try:
-            results = await _search_and_find_item(page, query.library, query)
+            # Admission happens here, before the job is handed over, so worker
+            # searches share the global cap, priorities and fast 429/503 with
+            # everything else instead of piling up in the workers' queues
+            async with browser_scheduler.job(query.library, priority, max_wait=_slot_wait()):
+                timeout = budget_seconds("search in scrape worker", scrape_workers_module.SCRAPE_WORKER_JOB_TIMEOUT_SECONDS)
+                # The worker applies what's left of our deadline to its own steps and
+                # sends results back as it parses them
+                results = []
+                payload = {**query.model_dump(), "deadline_seconds": timeout}
+                async for record in scrape_workers.stream("search", payload, timeout=timeout):
+                    result = BookSearchResult(**record)
+                    _emit_results([result])
+                    results.append(result)
+                return results
+        except ScrapeWorkerError as e:
+            # Only a lost worker falls back; busy/timeout/scrape errors from a
+            # worker are re-raised as is so overload doesn't spill onto this loop
+            print(f"DEBUG: Scrape worker search was lost ({e}), searching in-process")
+    return await scrape_catalog_local(query, priority)
+
+async def scrape_catalog_local(query: BookSearchQuery, priority: int = PRIORITY_INTERACTIVE) -> List[BookSearchResult]:
+    """Run a live catalog search, over plain HTTP when possible, else in a pooled browser context."""
+    if bibliocommons_http.HTTP_SEARCH_ENABLED:
+        results = await _search_via_http(query)
+        if results is not None:
             return results
-        finally:
-            await browser.close()
-
-async def place_hold(request: PlaceHoldRequest) -> Hold:
-    """Public function to log in and place a hold."""
-    async with async_playwright() as p:
-        browser: Browser = await p.chromium.launch(
-            headless=True,
-            args=[
-                '--no-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-blink-features=AutomationControlled',
-                '--disable-features=IsolateOrigins,site-per-process'
-            ]
-        )
-        # Create context with realistic viewport and user agent
-        context = await browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
-        page: Page = await context.new_page()
-        
-        # Add extra properties to avoid detection
-        await page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
-            window.chrome = {runtime: {}};
-        """)
+        print("DEBUG: HTTP search unusable, falling back to the browser")
+    
+    # Wait for a browser slot, then borrow a warm context from the shared pool
+    async with browser_scheduler.job(query.library, priority, max_wait=_slot_wait()):
+        async with browser_pool.context() as context:
+            page: Page = await _new_page(context, query.library)
+            return await _search_and_find_item(page, query.library, query)
+
+async def _scrape_and_cache(query: BookSearchQuery, cache_key: str) -> List[Dict[str, Any]]:
+    results = await _scrape_catalog(query)
+    records = [result.model_dump() for result in results]
+    if records:
+        # Empty results usually mean a scrape problem, so they are not cached
+        search_cache.set(cache_key, records)
+    return records
+
+async def _scrape_shared(query: BookSearchQuery, cache_key: str) -> List[Dict[str, Any]]:
+    # Callers with any budget may join this scrape, so it runs under the standard
+    # search budget, not the (maybe much shorter) one of whoever started it
+    with deadline_scope(SEARCH_DEADLINE_SECONDS, detached=True):
+        return await _scrape_and_cache(query, cache_key)
+
+def _scrape_coalesced(query: BookSearchQuery, cache_key: str):
+    """Scrape through the single-flight group so identical concurrent searches share one scrape."""
+    return search_flight.do(cache_key, lambda: _scrape_shared(query, cache_key))
+
+async def search_library_catalog(query: BookSearchQuery, deadline_seconds: Optional[float] = None) -> List[BookSearchResult]:
+    """
+    Public function to search the library catalog. The whole search, including
+    any wait for a shared in-flight scrape, is bounded by ``deadline_seconds``
+    (SEARCH_DEADLINE_SECONDS by default); running out raises ScrapeTimeoutError.
+    """
+    print(f"DEBUG: Received search query: '{query.query}' for library '{query.library}' with search_type '{query.search_type}'")
+    cache_key = make_key(query.library, query.query, query.search_type, query.limit, query.max_pages)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        records, fresh = cached
+        if not fresh:
+            # Serve the stale answer now and revalidate it in the background
+            search_cache.refresh_in_background(cache_key, lambda: _scrape_coalesced(query, cache_key))
+        print(f"DEBUG: Search cache {'hit' if fresh else 'stale hit'} for '{cache_key}'")
+        return [BookSearchResult(**record) for record in records]
+
+    with deadline_scope(deadline_seconds or SEARCH_DEADLINE_SECONDS) as deadline:
+        try:
+            # The shared scrape has its own budget; each caller only waits as long as its own allows
+            records = await asyncio.wait_for(_scrape_coalesced(query, cache_key), deadline.remaining())
+        except asyncio.TimeoutError:
+            raise ScrapeTimeoutError("wait for search results", deadline.budget_seconds)
+    # Every caller gets its own result objects even when the scrape was shared
+    return [BookSearchResult(**record) for record in records]
+
+# --- Streaming Search ---
+
+# Set while a streaming search runs; the scrape hands it results as soon as they're parsed
+_result_sink: contextvars.ContextVar[Optional[Callable[[BookSearchResult], None]]] = contextvars.ContextVar(
+    "search_result_sink", default=None
+)
+
+def _emit_results(results: List[BookSearchResult]):
+    sink = _result_sink.get()
+    if sink is not None:
+        for result in results:
+            sink(result)
+
+def _emit_records(records: List[Dict[str, Any]], library_name: str, start: int):
+    """Parse and emit the physical books among freshly read records (only when someone is streaming)."""
+    if _result_sink.get() is not None:
+        physical_books, _ = split_by_format(records, library_name, start=start)
+        _emit_results(physical_books)
+
+async def _stream_scrape(
+    scrape: Callable[[], Awaitable[List[BookSearchResult]]],
+    deadline_seconds: float,
+) -> AsyncIterator[BookSearchResult]:
+    """
+    Run a scrape in its own task with a result sink attached and yield results
+    as they're emitted, then any final results that weren't (paths that only
+    produce results at the end, like the HTTP search). Closing the iterator
+    cancels the scrape.
+    """
+    results_queue: asyncio.Queue = asyncio.Queue()
+    
+    async def _run():
+        _result_sink.set(results_queue.put_nowait)
         try:
-            # 1. Login
-            await _login_to_library(page, request.library_name, request.library_card_number, request.library_pin)
+            with deadline_scope(deadline_seconds):
+                return await scrape()
+        finally:
+            results_queue.put_nowait(None)
+    
+    deadline = Deadline(deadline_seconds)
+    task = asyncio.create_task(_run())
+    emitted = set()
+    try:
+        while True:
+            try:
+                result = await asyncio.wait_for(results_queue.get(), deadline.remaining())
+            except asyncio.TimeoutError:
+                raise ScrapeTimeoutError("wait for search results", deadline_seconds)
+            if result is None:
+                break
+            if result.library_item_id not in emitted:
+                emitted.add(result.library_item_id)
+                yield result
+        for result in await task:
+            if result.library_item_id not in emitted:
+                emitted.add(result.library_item_id)
+                yield result
+    finally:
+        if not task.done():
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+def stream_catalog_local(query: BookSearchQuery, deadline_seconds: Optional[float] = None) -> AsyncIterator[BookSearchResult]:
+    """scrape_catalog_local, yielding results as they're parsed (used by the scrape workers)."""
+    return _stream_scrape(lambda: scrape_catalog_local(query), deadline_seconds or SEARCH_DEADLINE_SECONDS)
+
+async def stream_library_catalog(query: BookSearchQuery, deadline_seconds: Optional[float] = None) -> AsyncIterator[BookSearchResult]:
+    """
+    Like search_library_catalog, but yields each result as soon as it's parsed.
+    Cached searches are replayed at once. Streamed searches run their own scrape
+    (they can't share one that is already in flight) but still fill the cache.
+    """
+    cache_key = make_key(query.library, query.query, query.search_type, query.limit, query.max_pages)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        records, fresh = cached
+        if not fresh:
+            search_cache.refresh_in_background(cache_key, lambda: _scrape_coalesced(query, cache_key))
+        for record in records:
+            yield BookSearchResult(**record)
+        return
+    
+    scrape = _stream_scrape(lambda: _scrape_and_cache_results(query, cache_key), deadline_seconds or SEARCH_DEADLINE_SECONDS)
+    async for result in scrape:
+        yield result
+
+async def _scrape_and_cache_results(query: BookSearchQuery, cache_key: str) -> List[BookSearchResult]:
+    return [BookSearchResult(**record) for record in await _scrape_and_cache(query, cache_key)]
+
+def _event(event: str, data: Any) -> Dict[str, Any]:
+    if hasattr(data, "model_dump"):
+        data = data.model_dump(mode="json")
+    return {"event": event, "data": data}
+
+async def search_events(query: BookSearchQuery) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Events for a streamed single-library search: one "result" per book as it's
+    parsed, an "error" if the search fails part way, and a final "summary".
+    """
+    started = time.monotonic()
+    count = 0
+    status = "ok"
+    try:
+        async for result in stream_library_catalog(query):
+            count += 1
+            yield _event("result", result)
+    except Exception as e:
+        status = "timeout" if isinstance(e, ScrapeTimeoutError) else "error"
+        yield _event("error", {"detail": str(e), "step": getattr(e, "step", None)})
+    yield _event("summary", {
+        "library": query.library,
+        "status": status,
+        "result_count": count,
+        "elapsed_ms": int((time.monotonic() - started) * 1000),
+    })
+
+async def federated_search_events(query: FederatedSearchQuery, library_names: List[str]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Events for a streamed federated search: "result" events (deduplicated across
+    libraries) as each library produces them, a "library" status event as each
+    library finishes, then a "summary" with every library's status.
+    """
+    started = time.monotonic()
+    events: asyncio.Queue = asyncio.Queue()
+    
+    async def _search_one(library_name: str):
+        library_started = time.monotonic()
+        status = {"library": library_name, "status": "ok", "result_count": 0, "error": None}
+        if library_name not in LIBRARY_URLS:
+            status["status"] = "unsupported"
+        else:
+            library_query = BookSearchQuery(
+                query=query.query, search_type=query.search_type, library=library_name,
+                limit=query.limit, max_pages=query.max_pages,
+            )
+            
+            async def _collect():
+                async for result in stream_library_catalog(library_query, deadline_seconds=query.timeout_seconds):
+                    status["result_count"] += 1
+                    events.put_nowait(("result", result))
+            
+            try:
+                await asyncio.wait_for(_collect(), query.timeout_seconds)
+            except (asyncio.TimeoutError, ScrapeTimeoutError):
+                status["status"] = "timeout"
+            except Exception as e:
+                status["status"] = "error"
+                status["error"] = str(e)
+        status["elapsed_ms"] = int((time.monotonic() - library_started) * 1000)
+        events.put_nowait(("library", status))
+    
+    tasks = [asyncio.create_task(_search_one(name)) for name in library_names]
+    statuses: List[Dict[str, Any]] = []
+    seen = set()
+    try:
+        while len(statuses) < len(tasks):
+            kind, data = await events.get()
+            if kind == "library":
+                statuses.append(data)
+                yield _event("library", data)
+            elif dedupe_key(data) not in seen:
+                seen.add(dedupe_key(data))
+                yield _event("result", data)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    yield _event("summary", {
+        "result_count": len(seen),
+        "libraries": statuses,
+        "elapsed_ms": int((time.monotonic() - started) * 1000),
+    })
+
+async def federated_search(query: FederatedSearchQuery, library_names: List[str]) -> Dict[str, Any]:
+    """
+    Search several libraries concurrently. Each library gets its own time limit,
+    so a slow site only drops its own results; the others are merged and
+    deduplicated by ISBN or normalized title + author.
+    """
+    async def _search_one(library_name: str):
+        started = time.monotonic()
+        status = {"library": library_name, "status": "ok", "result_count": 0, "error": None}
+        results: List[BookSearchResult] = []
+        if library_name not in LIBRARY_URLS:
+            status["status"] = "unsupported"
+        else:
+            library_query = BookSearchQuery(
+                query=query.query, search_type=query.search_type, library=library_name,
+                limit=query.limit, max_pages=query.max_pages,
+            )
+            try:
+                results = await asyncio.wait_for(
+                    search_library_catalog(library_query, deadline_seconds=query.timeout_seconds), query.timeout_seconds
+                )
+                status["result_count"] = len(results)
+            except (asyncio.TimeoutError, ScrapeTimeoutError):
+                status["status"] = "timeout"
+            except Exception as e:
+                status["status"] = "error"
+                status["error"] = str(e)
+        status["elapsed_ms"] = int((time.monotonic() - started) * 1000)
+        print(f"DEBUG: Federated search at {library_name}: {status['status']} in {status['elapsed_ms']} ms")
+        return results, status
+    
+    outcomes = await asyncio.gather(*(_search_one(name) for name in library_names))
+    return {
+        "results": merge_results([results for results, _ in outcomes]),
+        "libraries": [status for _, status in outcomes],
+    }
+
+async def place_hold(
+    request: PlaceHoldRequest,
+    deadline_seconds: Optional[float] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Hold:
+    """
+    Public function to log in and place a hold, within ``deadline_seconds``
+    (HOLD_DEADLINE_SECONDS by default).
+    """
+    with deadline_scope(deadline_seconds or HOLD_DEADLINE_SECONDS):
+        return await _place_hold(request, priority)
+
+async def _place_hold(request: PlaceHoldRequest, priority: int) -> Hold:
+    # Restore the card's session if we have one; the context is private either way
+    storage_state = session_cache.get(request.library_name, request.library_card_number, request.library_pin)
+    async with browser_scheduler.job(request.library_name, priority, max_wait=_slot_wait()):
+        async with browser_pool.context(storage_state=storage_state, private=True) as context:
+            page: Page = await _new_page(context, request.library_name)
+            
+            # 1. Login (skipped when the cached session is still valid)
+            await _ensure_logged_in(
+                page, request.library_name, request.library_card_number, request.library_pin,
+                restored=storage_state is not None,
+            )
             
             # 2. Place Hold
             status_data = await _place_hold_on_item(page, request.library_name, request.library_item_id)
             
             # 3. Return the hold data (without ID - it will be created by the endpoint)
-            from schemas.schemas import HoldBase
             return {
                 "title": request.title,
                 "author": request.author,
@@ -731,40 +1266,103 @@ async def place_hold(request: PlaceHoldRequest) -> Hold:
                 "library_item_id": request.library_item_id,
                 **status_data
             }
-        finally:
-            await context.close()
-            await browser.close()
-
-async def check_hold_status(hold: HoldModel) -> Dict[str, Any]:
-    """Public function to check the status of a single hold."""
-    # NOTE: In a real application, you would need to securely retrieve the user's
-    # card number and PIN using the hold.user_id to log in.
-    # For this simulation, we will bypass login for the status check.
-    
-    # *** SIMULATION: Return an updated status without actual login ***
-    # In a real scenario, you would launch Playwright, log in, and call _check_hold_status_on_page
-    
-    # For the purpose of the API test, we'll use the simulation logic directly
-    if hold.queue_position is None:
-        return {
-            "status": "Pending",
-            "queue_position": 10,
-            "estimated_wait_days": 30,
-            "last_checked": datetime.utcnow(),
-        }
-    
-    if hold.queue_position > 1:
-        new_position = max(1, hold.queue_position - 1)
-        new_days = max(0, hold.estimated_wait_days - 1)
-        new_status = "In Transit" if new_position < 5 else "Pending"
-    else:
-        new_position = 0
-        new_days = 0
-        new_status = "Ready for Pickup"
 
-    return {
-        "status": new_status,
-        "queue_position": new_position,
-        "estimated_wait_days": new_days,
-        "last_checked": datetime.utcnow(),
-    }
+async def place_holds_batch(
+    library_name: str,
+    card_number: str,
+    pin: str,
+    items: List[BatchHoldItem],
+    deadline_seconds: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Log in once and place holds on several items with the same card, a few tabs
+    at a time. Returns one entry per item, in order, with either the hold data
+    or the error for that item. Items not reached before the deadline
+    (HOLD_BATCH_DEADLINE_SECONDS by default) fail with a timeout error.
+    """
+    with deadline_scope(deadline_seconds or HOLD_BATCH_DEADLINE_SECONDS):
+        return await _place_holds_batch(library_name, card_number, pin, items)
+
+async def _place_holds_batch(library_name: str, card_number: str, pin: str, items: List[BatchHoldItem]) -> List[Dict[str, Any]]:
+    storage_state = session_cache.get(library_name, card_number, pin)
+    async with browser_scheduler.job(library_name, PRIORITY_INTERACTIVE, max_wait=_slot_wait()):
+        async with browser_pool.context(storage_state=storage_state, private=True) as context:
+            login_page: Page = await _new_page(context, library_name)
+            await _ensure_logged_in(login_page, library_name, card_number, pin, restored=storage_state is not None)
+            
+            # The logged-in cookies are shared by every tab in the context
+            tabs = asyncio.Semaphore(max(1, HOLD_BATCH_TABS))
+            
+            async def _place_one(item: BatchHoldItem) -> Dict[str, Any]:
+                async with tabs:
+                    page = await _new_page(context, library_name)
+                    try:
+                        status_data = await _place_hold_on_item(page, library_name, item.library_item_id)
+                        return {
+                            "success": True,
+                            "hold_data": {
+                                "title": item.title,
+                                "author": item.author,
+                                "isbn": item.isbn,
+                                "library_name": library_name,
+                                "library_item_id": item.library_item_id,
+                                **status_data
+                            },
+                        }
+                    except Exception as e:
+                        return {"success": False, "error": str(e)}
+                    finally:
+                        await page.close()
+            
+            return await asyncio.gather(*(_place_one(item) for item in items))
+
+def supports_hold_refresh(library_name: str) -> bool:
+    """Whether the holds page of this library can be read back."""
+    return library_name in HOLDS_PAGE_LIBRARIES and library_name in LIBRARY_URLS
+
+async def fetch_hold_records(
+    library_name: str,
+    card_number: str,
+    pin: str,
+    priority: int = PRIORITY_BACKGROUND,
+    deadline_seconds: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Log in with a card and read every hold on its 'My Holds' page in one pass.
+    The caller waits at most ``deadline_seconds`` (HOLD_READ_DEADLINE_SECONDS by
+    default); running out raises ScrapeTimeoutError. Raises if the holds page
+    couldn't be read.
+    """
+    # Reads only coalesce within a priority class, so a caller never ends up
+    # queued behind a lower class just because that read started first
+    # Hashed like the session cache key: the flight key shows up in the logs
+    key = f"{_digest(library_name, card_number)}|{priority}"
+    with deadline_scope(deadline_seconds or HOLD_READ_DEADLINE_SECONDS) as deadline:
+        try:
+            records = await asyncio.wait_for(
+                hold_status_flight.do(key, lambda: _fetch_hold_records_shared(library_name, card_number, pin, priority)),
+                deadline.remaining(),
+            )
+        except asyncio.TimeoutError:
+            raise ScrapeTimeoutError("wait for holds page", deadline.budget_seconds)
+    return [dict(record) for record in records]
+
+async def _fetch_hold_records_shared(library_name: str, card_number: str, pin: str, priority: int) -> List[Dict[str, Any]]:
+    # Callers with any budget may join this read, so it runs under the standard
+    # hold read budget, not the one of whoever started it
+    with deadline_scope(HOLD_READ_DEADLINE_SECONDS, detached=True):
+        return await _fetch_hold_records(library_name, card_number, pin, priority)
+
+async def _fetch_hold_records(library_name: str, card_number: str, pin: str, priority: int) -> List[Dict[str, Any]]:
+    storage_state = session_cache.get(library_name, card_number, pin)
+    restored = storage_state is not None
+    async with browser_scheduler.job(library_name, priority, max_wait=_slot_wait()):
+        async with browser_pool.context(storage_state=storage_state, private=True) as context:
+            page: Page = await _new_page(context, library_name)
+            # Validating a restored session already loads My Holds; _read_holds_page reuses it
+            await _ensure_logged_in(page, library_name, card_number, pin, restored=restored)
+            records = await _read_holds_page(page, library_name)
+            if records is None:
+                raise Exception(f"Could not read the holds page for {library_name}")
+            print(f"DEBUG: Read {len(records)} holds from {library_name} holds page")
+            return records
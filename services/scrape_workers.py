@@ -0,0 +1,306 @@
+"""
+Multi-process scraping workers.
+
+With SCRAPE_WORKERS > 0, catalog searches run in separate worker processes
+instead of on the API's event loop. Each worker owns its own Chromium (via its
+own browser_pool), reads jobs from a per-worker multiprocessing queue and
+streams results back over a shared result queue, one message per result
+followed by a final "done" (or "error"). Jobs go to the least busy live
+worker; a monitor task restarts workers that die and fails their in-flight
+jobs so callers can fall back. Errors raised by a job itself (a busy browser
+scheduler, a deadline running out, a failed scrape) are sent back typed and
+re-raised as the same kind of error in the API process. Admission control
+stays in the API process too: callers hold a browser_scheduler slot for the
+whole job, so the global cap and priorities cover worker searches as well.
+
+With SCRAPE_WORKERS = 0 (the default) everything keeps running in-process.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Optional, List, Dict, Any, AsyncIterator
+
+from services.browser_scheduler import SchedulerBusyError
+from services.deadline import ScrapeTimeoutError
+
+# --- Configuration ---
+SCRAPE_WORKERS = int(os.getenv("SCRAPE_WORKERS", "0"))
+SCRAPE_WORKER_CONCURRENCY = int(os.getenv("SCRAPE_WORKER_CONCURRENCY", "2"))
+SCRAPE_WORKER_HEALTH_SECONDS = 1.0
+SCRAPE_WORKER_JOB_TIMEOUT_SECONDS = float(os.getenv("SCRAPE_WORKER_JOB_TIMEOUT_SECONDS", "120"))
+
+# Message types on the result queue
+MSG_ITEM = "item"
+MSG_DONE = "done"
+MSG_ERROR = "error"
+
+# Error kinds carried by MSG_ERROR
+ERROR_BUSY = "busy"        # SchedulerBusyError in the worker
+ERROR_TIMEOUT = "timeout"  # ScrapeTimeoutError in the worker
+ERROR_FAILED = "failed"    # Any other exception raised by the job
+ERROR_LOST = "lost"        # The worker died or the pool stopped
+
+
+class ScrapeWorkerError(Exception):
+    """A job was lost with its worker process (or no workers are running); safe to retry in-process."""
+
+
+class ScrapeJobError(Exception):
+    """A job ran in a worker and failed there."""
+
+
+def _error_message(exc: BaseException) -> Dict[str, Any]:
+    if isinstance(exc, SchedulerBusyError):
+        return {"kind": ERROR_BUSY, "message": str(exc), "retry_after": exc.retry_after, "status_code": exc.status_code}
+    if isinstance(exc, ScrapeTimeoutError):
+        return {"kind": ERROR_TIMEOUT, "message": str(exc), "step": exc.step, "budget_seconds": exc.budget_seconds}
+    return {"kind": ERROR_FAILED, "message": f"{type(exc).__name__}: {exc}"}
+
+
+def _raise_error(error: Dict[str, Any]):
+    """Re-raise a worker's error in the API process as the same kind of exception."""
+    kind = error.get("kind")
+    if kind == ERROR_BUSY:
+        raise SchedulerBusyError(error["message"], error["retry_after"], status_code=error["status_code"])
+    if kind == ERROR_TIMEOUT:
+        raise ScrapeTimeoutError(error["step"], error.get("budget_seconds"))
+    if kind == ERROR_FAILED:
+        raise ScrapeJobError(error["message"])
+    raise ScrapeWorkerError(error["message"])
+
+
+# --- Worker Process ---
+
+async def _handle_search(payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    from schemas.schemas import BookSearchQuery
+    from services import library_service
+    payload = dict(payload)
+    # The caller's remaining budget, so the worker gives up when the caller does
+    deadline_seconds = payload.pop("deadline_seconds", None)
+    async for result in library_service.stream_catalog_local(BookSearchQuery(**payload), deadline_seconds):
+        yield result.model_dump()
+
+
+# Handlers are async generators, so each result is sent back as soon as it exists
+JOB_HANDLERS = {
+    "search": _handle_search,
+}
+
+
+async def _worker_loop(index: int, request_queue, result_queue):
+    from services.browser_pool import browser_pool
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        print(f"WARNING: Scrape worker {index} could not start its browser: {e}")
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(SCRAPE_WORKER_CONCURRENCY)
+    tasks = set()
+
+    async def _run(job: Dict[str, Any]):
+        try:
+            handler = JOB_HANDLERS[job["kind"]]
+            async for item in handler(job["payload"]):
+                result_queue.put((job["id"], MSG_ITEM, item))
+            result_queue.put((job["id"], MSG_DONE, None))
+        except Exception as e:
+            result_queue.put((job["id"], MSG_ERROR, _error_message(e)))
+        finally:
+            slots.release()
+
+    while True:
+        await slots.acquire()
+        job = await loop.run_in_executor(None, request_queue.get)
+        if job is None:
+            break
+        task = asyncio.create_task(_run(job))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await browser_pool.stop()
+    from services.selector_engine import selector_engine
+    selector_engine.save()
+
+
+def _worker_main(index: int, request_queue, result_queue):
+    print(f"DEBUG: Scrape worker {index} started (pid {os.getpid()})")
+    try:
+        asyncio.run(_worker_loop(index, request_queue, result_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+# --- Main Process Side ---
+
+class _Worker:
+    def __init__(self, index: int, process, request_queue):
+        self.index = index
+        self.process = process
+        self.request_queue = request_queue
+        self.in_flight: set = set()
+
+
+class _Job:
+    def __init__(self, worker: _Worker):
+        self.worker = worker
+        self.messages: asyncio.Queue = asyncio.Queue()
+
+
+class ScrapeWorkerPool:
+    def __init__(self, workers: int = SCRAPE_WORKERS):
+        self.size = workers
+        # spawn: a fresh interpreter per worker, never a fork of the running event loop
+        self._mp = multiprocessing.get_context("spawn")
+        self._workers: List[_Worker] = []
+        self._jobs: Dict[str, _Job] = {}
+        self._result_queue = None
+        self._reader: Optional[threading.Thread] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self.restarts = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._workers) and not self._stopping
+
+    def _spawn(self, index: int) -> _Worker:
+        request_queue = self._mp.Queue()
+        process = self._mp.Process(
+            target=_worker_main,
+            args=(index, request_queue, self._result_queue),
+            name=f"scrape-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        return _Worker(index, process, request_queue)
+
+    async def start(self):
+        if self._workers or self.size <= 0:
+            return
+        self._stopping = False
+        self._loop = asyncio.get_running_loop()
+        self._result_queue = self._mp.Queue()
+        self._workers = [self._spawn(i) for i in range(self.size)]
+        self._reader = threading.Thread(target=self._read_results, name="scrape-results", daemon=True)
+        self._reader.start()
+        self._monitor = asyncio.create_task(self._watch())
+        print(f"DEBUG: Started {self.size} scrape worker processes")
+
+    async def stop(self):
+        if not self._workers:
+            return
+        self._stopping = True
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+        for worker in self._workers:
+            worker.request_queue.put(None)
+        deadline = time.monotonic() + 10
+        for worker in self._workers:
+            await asyncio.to_thread(worker.process.join, max(0.1, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._result_queue.put(None)  # Unblocks the reader thread
+        self._workers = []
+        for job_id in list(self._jobs):
+            self._deliver(job_id, MSG_ERROR, {"kind": ERROR_LOST, "message": "Scrape workers stopped"})
+
+    def _read_results(self):
+        """Reader thread: hand every result message to the event loop."""
+        while True:
+            try:
+                message = self._result_queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopping:
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+            if message is None:
+                return
+            self._loop.call_soon_threadsafe(self._deliver, *message)
+
+    def _deliver(self, job_id: str, kind: str, data: Any):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return  # The caller gave up on this job
+        if kind in (MSG_DONE, MSG_ERROR):
+            del self._jobs[job_id]
+            job.worker.in_flight.discard(job_id)
+            if kind == MSG_DONE:
+                self.completed += 1
+            else:
+                self.failed += 1
+        job.messages.put_nowait((kind, data))
+
+    async def _watch(self):
+        """Restart dead workers and fail the jobs they took with them."""
+        while True:
+            await asyncio.sleep(SCRAPE_WORKER_HEALTH_SECONDS)
+            for position, worker in enumerate(self._workers):
+                if worker.process.is_alive():
+                    continue
+                print(f"❌ Scrape worker {worker.index} died (exit code {worker.process.exitcode}), restarting")
+                for job_id in list(worker.in_flight):
+                    self._deliver(job_id, MSG_ERROR, {"kind": ERROR_LOST, "message": f"Scrape worker {worker.index} crashed"})
+                self._workers[position] = self._spawn(worker.index)
+                self.restarts += 1
+
+    def _pick_worker(self) -> _Worker:
+        live = [worker for worker in self._workers if worker.process.is_alive()] or self._workers
+        return min(live, key=lambda worker: len(worker.in_flight))
+
+    async def stream(self, kind: str, payload: Dict[str, Any], timeout: float = SCRAPE_WORKER_JOB_TIMEOUT_SECONDS) -> AsyncIterator[Any]:
+        """Run a job in a worker and yield its results as they arrive."""
+        if not self.enabled:
+            raise ScrapeWorkerError("Scrape workers are not running")
+        job_id = uuid.uuid4().hex
+        worker = self._pick_worker()
+        job = _Job(worker)
+        self._jobs[job_id] = job
+        worker.in_flight.add(job_id)
+        worker.request_queue.put({"id": job_id, "kind": kind, "payload": payload})
+
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ScrapeTimeoutError(f"{kind} in scrape worker", timeout)
+                try:
+                    message_kind, data = await asyncio.wait_for(job.messages.get(), remaining)
+                except asyncio.TimeoutError:
+                    continue
+                if message_kind == MSG_ITEM:
+                    yield data
+                elif message_kind == MSG_DONE:
+                    return
+                else:
+                    _raise_error(data)
+        finally:
+            # Forget the job if we stopped listening early; late results are dropped
+            if self._jobs.pop(job_id, None) is not None:
+                worker.in_flight.discard(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "alive": sum(1 for worker in self._workers if worker.process.is_alive()),
+            "in_flight": {worker.index: len(worker.in_flight) for worker in self._workers},
+            "restarts": self.restarts,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+# Shared pool started in the app lifespan
+scrape_workers = ScrapeWorkerPool()
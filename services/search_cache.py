@@ -0,0 +1,155 @@
+"""
+Result cache in front of search_library_catalog.
+
+Bounded in-process LRU with age-based expiry and stale-while-revalidate,
+optionally backed by a SQLite file so warm entries survive restarts.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, Callable, Awaitable
+
+# --- Configuration ---
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+# Entries younger than this are served as-is
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+# Older entries are still served up to this age while a refresh runs in the background
+SEARCH_CACHE_STALE_SECONDS = int(os.getenv("SEARCH_CACHE_STALE_SECONDS", str(24 * 60 * 60)))
+# Set to a file path (e.g. "./search_cache.db") to keep entries across restarts
+SEARCH_CACHE_DB_PATH = os.getenv("SEARCH_CACHE_DB_PATH", "")
+
+
+def make_key(library: str, query: str, search_type: str, limit: int = 5, max_pages: Optional[int] = None) -> str:
+    """Normalize a search so trivially different spellings share an entry."""
+    normalized_query = " ".join(query.lower().split())
+    pages = max_pages if max_pages is not None else "default"
+    return f"{library.strip().lower()}|{search_type.strip().lower()}|{limit}|{pages}|{normalized_query}"
+
+
+class SearchCache:
+    """LRU + TTL cache of JSON-serializable search results."""
+
+    def __init__(
+        self,
+        max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = SEARCH_CACHE_TTL_SECONDS,
+        stale_seconds: int = SEARCH_CACHE_STALE_SECONDS,
+        db_path: str = SEARCH_CACHE_DB_PATH,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = max(stale_seconds, ttl_seconds)
+        # key -> (stored_at wall-clock seconds, value)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, stored_at: float, value: Any):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_from_disk(self, key: str) -> Optional[Tuple[float, Any]]:
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT stored_at, value FROM search_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def get(self, key: str) -> Optional[Tuple[Any, bool]]:
+        """
+        Return ``(value, is_fresh)`` or None on a miss. Entries past the stale
+        window are dropped and count as misses.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load_from_disk(key)
+            if entry is not None:
+                self._remember(key, *entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, value = entry
+        age = time.time() - stored_at
+        if age >= self.stale_seconds:
+            self.invalidate(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if age < self.ttl_seconds:
+            self.hits += 1
+            return value, True
+        self.stale_hits += 1
+        return value, False
+
+    def set(self, key: str, value: Any):
+        stored_at = time.time()
+        self._remember(key, stored_at, value)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), stored_at),
+            )
+            # Keep the file bounded by the same age limit as memory
+            self._db.execute("DELETE FROM search_cache WHERE stored_at < ?", (stored_at - self.stale_seconds,))
+            self._db.commit()
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+            self._db.commit()
+
+    def refresh_in_background(self, key: str, fetch: Callable[[], Awaitable[Optional[Any]]]):
+        """Revalidate a stale entry without making the caller wait; one refresh per key."""
+        if key in self._refreshing:
+            return
+
+        async def _refresh():
+            try:
+                value = await fetch()
+                if value:
+                    self.set(key, value)
+                self.refreshes += 1
+            except Exception as e:
+                print(f"DEBUG: Background refresh failed for '{key}': {e}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(_refresh())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+            "background_refreshes": self.refreshes,
+            "refreshing": len(self._refreshing),
+            "persistent": self._db is not None,
+        }
+
+
+# Shared cache used by library_service
+search_cache = SearchCache()
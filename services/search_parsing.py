@@ -0,0 +1,260 @@
+"""
+Parsing helpers for BiblioCommons search results.
+
+Raw result records are plain dicts with the text/attributes pulled from one
+search result item. They can be produced in a single round trip by running
+EXTRACT_RESULTS_JS inside the page, or element by element through Playwright
+handles; either way record_to_result turns them into BookSearchResult.
+"""
+import re
+from typing import Dict, Any, List, Optional, Tuple
+from schemas.schemas import BookSearchResult
+
+# --- Selectors ---
+RESULT_ITEM_SELECTOR = '.cp-search-result-item-content'
+
+TITLE_SELECTORS = [
+    'h2 a', '.title-content a', '[data-testid="bib-title"] a',
+    '.cp-search-result-item-title a', '.title a', 'a.title-link',
+    'h3 a', '.cp-bib-list-item-title a', '.listItemTitle a',
+    'a[href*="/item/show/"]', '.title', 'h2', 'h3'
+]
+# Last-resort title matches: they find the text but have no link, so no item ID
+GENERIC_TITLE_SELECTORS = ['.title', 'h2', 'h3']
+
+AUTHOR_SELECTORS = [
+    '.author-link', '.author', '[data-testid="bib-author"]',
+    '.cp-search-result-item-author', '.subtitle'
+]
+
+AVAILABILITY_SELECTORS = [
+    '.availability-line', '.item-availability', '[data-testid="availability"]',
+    '.cp-availability', '.status'
+]
+
+ISBN_SELECTOR = '.isbn, .identifier'
+
+# --- Classification ---
+
+# Check full title text for format info
+NON_BOOK_KEYWORDS = [
+    'ebook', 'e-book', 'digital', 'downloadable', 'online',
+    'audiobook', 'audio book', 'sound recording', 'playaway',
+    'hoopla', 'overdrive', 'streaming', 'electronic resource',
+    'compact disc', 'spoken word'
+]
+
+# Specific format indicators in the item text (avoids false positives such as
+# "Also available as eBook")
+NON_BOOK_TEXT_MARKERS = [
+    "format: ebook", "format: downloadable", "format: audiobook",
+    "format: cd", "format: sound recording",
+    # Strong keywords that usually indicate non-book format
+    "downloadable music", "streaming video", "electronic resource",
+]
+
+# Physical formats override the markers above (e.g. if "Format: Book" is
+# present, it's a book even if "eBook" is mentioned elsewhere)
+PHYSICAL_TEXT_MARKERS = [
+    "format: book", "format: hardcover", "format: paperback", "format: large print"
+]
+
+# Various URL patterns for BiblioCommons item links
+ITEM_ID_PATTERNS = [
+    r'/item/show/(\d+)',           # Original pattern
+    r'/v2/record/(\w+)',           # BiblioCommons v2 pattern
+    r'/record/(\w+)',              # Alternative record pattern
+    r'item_id=(\d+)',              # Query parameter
+    r'/(\d+)$',                    # ID at end of URL
+]
+
+# Runs inside the page and applies the same selector fallbacks as the
+# handle-based path, returning one raw record per result item (plus which
+# title selector matched, for the selector telemetry).
+EXTRACT_RESULTS_JS = """
+(args) => {
+    const text = (el) => (el && el.innerText) ? el.innerText : "";
+    const first = (root, selectors) => {
+        for (const selector of selectors) {
+            const el = root.querySelector(selector);
+            if (el) return el;
+        }
+        return null;
+    };
+    const items = Array.from(document.querySelectorAll(args.itemSelector))
+        .slice(args.start, args.start + args.limit);
+    return items.map((item) => {
+        let titleText = "";
+        let titleHref = "";
+        let titleSelector = null;
+        for (const selector of args.titleSelectors) {
+            const el = item.querySelector(selector);
+            if (el && text(el).trim()) {
+                titleText = text(el).trim();
+                titleHref = el.getAttribute("href") || "";
+                titleSelector = selector;
+                break;
+            }
+        }
+        return {
+            title_text: titleText,
+            title_href: titleHref,
+            title_selector: titleSelector,
+            item_text: text(item),
+            author: text(first(item, args.authorSelectors)),
+            availability: text(first(item, args.availabilitySelectors)),
+            isbn_text: text(item.querySelector(args.isbnSelector)),
+        };
+    });
+}
+"""
+
+
+def extract_args(start: int = 0, limit: int = 30, title_selectors: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Arguments passed to EXTRACT_RESULTS_JS by page.evaluate."""
+    return {
+        "itemSelector": RESULT_ITEM_SELECTOR,
+        "titleSelectors": title_selectors or TITLE_SELECTORS,
+        "authorSelectors": AUTHOR_SELECTORS,
+        "availabilitySelectors": AVAILABILITY_SELECTORS,
+        "isbnSelector": ISBN_SELECTOR,
+        "start": start,
+        "limit": limit,
+    }
+
+
+def is_non_book_record(full_title_text: str, item_text: str) -> bool:
+    """Decide whether a result is an eBook/audiobook/etc rather than a physical book."""
+    item_text_lower = item_text.lower()
+    is_non_book = any(keyword in full_title_text.lower() for keyword in NON_BOOK_KEYWORDS)
+    if not is_non_book:
+        is_non_book = any(marker in item_text_lower for marker in NON_BOOK_TEXT_MARKERS)
+    if any(marker in item_text_lower for marker in PHYSICAL_TEXT_MARKERS):
+        is_non_book = False
+    return is_non_book
+
+
+def count_physical(records: List[Dict[str, Any]]) -> int:
+    """Cheap count of physical books among raw records, without building results."""
+    return sum(
+        1 for record in records
+        if not is_non_book_record(record.get("title_text") or "", record.get("item_text") or "")
+    )
+
+
+def take_physical(records: List[Dict[str, Any]], wanted: int, found: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Walk raw records in page order until ``wanted`` physical books have been
+    seen (counting ``found`` already seen earlier). Returns the records up to
+    and including the last one needed, and the new physical count.
+    """
+    for index, record in enumerate(records):
+        if found >= wanted:
+            return records[:index], found
+        if not is_non_book_record(record.get("title_text") or "", record.get("item_text") or ""):
+            found += 1
+    return records, found
+
+
+def extract_item_id(href: Optional[str]) -> Optional[str]:
+    """Pull the library item ID out of a result link."""
+    for pattern in ITEM_ID_PATTERNS:
+        item_id_match = re.search(pattern, href or "")
+        if item_id_match:
+            return item_id_match.group(1)
+    return None
+
+
+def record_to_result(record: Dict[str, Any], index: int, library_name: str) -> Tuple[BookSearchResult, bool]:
+    """
+    Build a BookSearchResult from a raw record.
+
+    Returns the result and whether it is a non-book format. ``index`` is the
+    zero-based position on the page, used for the fallback item ID.
+    """
+    full_title_text = (record.get("title_text") or "").strip() or "Unknown Title"
+    title = full_title_text
+    # If title has multiple lines, take the first one for the clean title
+    if '\n' in title:
+        title = title.split('\n')[0].strip()
+
+    item_text = record.get("item_text") or ""
+    # If still no title, try getting any text content from the item
+    if title == "Unknown Title":
+        for line in item_text.split('\n'):
+            line = line.strip()
+            if line and len(line) > 5 and 'by ' not in line.lower():
+                title = line
+                full_title_text = title
+                break
+
+    is_non_book = is_non_book_record(full_title_text, item_text)
+
+    author = record.get("author") or "Unknown Author"
+    author = author.replace("by ", "").strip()
+
+    library_item_id = extract_item_id(record.get("title_href")) or f"unknown_{index+1}"
+
+    availability = record.get("availability") or "Unknown availability"
+
+    isbn = None
+    isbn_text = record.get("isbn_text")
+    if isbn_text:
+        isbn_match = re.search(r'(\d{13}|\d{10})', isbn_text)
+        isbn = isbn_match.group(1) if isbn_match else None
+
+    # Clean up title to remove format indicators
+    clean_title = title.replace(", eBook", "").replace(", eAudiobook", "").strip()
+
+    result = BookSearchResult(
+        title=clean_title,
+        author=author,
+        isbn=isbn,
+        library_item_id=library_item_id,
+        library_name=library_name,
+        availability=availability.strip()
+    )
+    return result, is_non_book
+
+
+def split_by_format(records: List[Dict[str, Any]], library_name: str, start: int = 0) -> Tuple[List[BookSearchResult], List[BookSearchResult]]:
+    """Classify raw records into (physical_books, non_books)."""
+    physical_books: List[BookSearchResult] = []
+    non_books: List[BookSearchResult] = []
+    for offset, record in enumerate(records):
+        try:
+            result, is_non_book = record_to_result(record, start + offset, library_name)
+        except Exception as e:
+            print(f"Error parsing search result item: {e}")
+            continue
+        if is_non_book:
+            non_books.append(result)
+            print(f"Found non-book format: {result.title} by {result.author} (ID: {result.library_item_id})")
+        else:
+            physical_books.append(result)
+            print(f"Found physical book: {result.title} by {result.author} (ID: {result.library_item_id})")
+    return physical_books, non_books
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join(re.sub(r'[^\w\s]', ' ', (text or "").lower()).split())
+
+
+def dedupe_key(result: BookSearchResult) -> str:
+    """Identity of a book across libraries: its ISBN, else normalized title + author."""
+    if result.isbn:
+        return f"isbn:{result.isbn}"
+    return f"title:{_normalize(result.title)}|{_normalize(result.author)}"
+
+
+def merge_results(result_lists: List[List[BookSearchResult]]) -> List[BookSearchResult]:
+    """Concatenate result lists in order, keeping the first copy of each book."""
+    merged: List[BookSearchResult] = []
+    seen = set()
+    for results in result_lists:
+        for result in results:
+            key = dedupe_key(result)
+            if key not in seen:
+                seen.add(key)
+                merged.append(result)
+    return merged
@@ -0,0 +1,252 @@
+"""
+Adaptive selector lookup.
+
+The scraping code carries long fallback lists for every element it needs
+(login fields, result containers, result titles, the hold button) because the
+library sites' markup varies. Probing them one by one with a timeout each adds
+seconds whenever the first guesses miss. The engine instead waits once for
+the whole list as a single combined selector, then works out which candidate
+matched, trying the ones that won before for that library and page type first.
+Broad fallbacks that can also match the wrong element (a bare ``h2``, any text
+input) are passed as ``generic``: they are never promoted by past wins and are
+only tried after every specific candidate, so one lucky match can't lock them
+in ahead of the selectors that find the right element.
+
+Win counts are persisted to a JSON file under DATA_DIR so the learned order
+survives restarts. The API and every scrape worker process record into the
+same file: each save re-reads it under a lock and adds only the counts
+gathered since the last save, so no process overwrites another's. The
+fallback depth (position of the winner in the original list) is reported so
+a markup change shows up in the metrics.
+"""
+import json
+import os
+import time
+try:
+    import fcntl
+except ImportError:  # Windows: saves are not serialised across processes
+    fcntl = None
+from collections import defaultdict
+from typing import Optional, List, Dict, Any, Tuple, Iterable
+from playwright.async_api import Page, ElementHandle, TimeoutError as PlaywrightTimeoutError
+
+# --- Configuration ---
+DATA_DIR = os.getenv("DATA_DIR", "data")
+SELECTOR_STATS_PATH = os.getenv("SELECTOR_STATS_PATH", os.path.join(DATA_DIR, "selector_stats.json"))
+SELECTOR_STATS_SAVE_SECONDS = 30
+
+
+class _SlotStats:
+    """Telemetry for one (library, page type) selector list."""
+
+    def __init__(self):
+        self.wins: Dict[str, int] = defaultdict(int)
+        self.misses = 0
+        self.lookups = 0
+        self.depth_total = 0
+        self.last_depth: Optional[int] = None
+        self.max_depth = 0
+
+    def add_win(self, selector: str, depth: int, count: int = 1):
+        self.wins[selector] += count
+        self.lookups += count
+        self.depth_total += depth * count
+        self.last_depth = depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def add_miss(self):
+        self.misses += 1
+        self.lookups += 1
+
+    def merge(self, other: "_SlotStats"):
+        """Add the counts of ``other`` (newer activity) to this slot."""
+        for selector, wins in other.wins.items():
+            self.wins[selector] += wins
+        self.misses += other.misses
+        self.lookups += other.lookups
+        self.depth_total += other.depth_total
+        if other.last_depth is not None:
+            self.last_depth = other.last_depth
+        self.max_depth = max(self.max_depth, other.max_depth)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "wins": dict(self.wins),
+            "misses": self.misses,
+            "lookups": self.lookups,
+            "depth_total": self.depth_total,
+            "last_depth": self.last_depth,
+            "max_depth": self.max_depth,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_SlotStats":
+        slot = cls()
+        slot.wins.update(data.get("wins") or {})
+        slot.misses = data.get("misses", 0)
+        slot.lookups = data.get("lookups", 0)
+        slot.depth_total = data.get("depth_total", 0)
+        slot.last_depth = data.get("last_depth")
+        slot.max_depth = data.get("max_depth", 0)
+        return slot
+
+
+class SelectorEngine:
+    def __init__(self, path: Optional[str] = SELECTOR_STATS_PATH):
+        self.path = path
+        self._slots: Dict[Tuple[str, str], _SlotStats] = {}
+        # Activity since the last save, added to the file's counts on save
+        self._pending: Dict[Tuple[str, str], _SlotStats] = {}
+        self._saved_at = time.monotonic()
+        self._load()
+
+    # --- Persistence ---
+
+    def _read_file(self) -> Dict[Tuple[str, str], _SlotStats]:
+        slots: Dict[Tuple[str, str], _SlotStats] = {}
+        if not self.path or not os.path.exists(self.path):
+            return slots
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            for library, page_types in data.items():
+                for page_type, slot in page_types.items():
+                    slots[(library, page_type)] = _SlotStats.from_dict(slot)
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"DEBUG: Ignoring unreadable selector stats file {self.path}: {e}")
+        return slots
+
+    def _load(self):
+        self._slots = self._read_file()
+        if self._slots:
+            print(f"DEBUG: Loaded selector stats for {len(self._slots)} selector lists from {self.path}")
+
+    def save(self, blocking: bool = True):
+        """
+        Add the activity since the last save to the stats on disk and write them
+        back (atomically, so a crash can't leave half a file). Picks up what
+        other processes saved in the meantime. With ``blocking=False`` the save
+        is skipped (and retried later) while another process holds the lock.
+        """
+        if not self.path or not self._pending:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.lock", "w") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                slots = self._read_file()
+                for key, pending in self._pending.items():
+                    slots.setdefault(key, _SlotStats()).merge(pending)
+                data: Dict[str, Dict[str, Any]] = defaultdict(dict)
+                for (library, page_type), slot in slots.items():
+                    data[library][page_type] = slot.to_dict()
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            self._slots = slots
+            self._pending = {}
+            self._saved_at = time.monotonic()
+        except BlockingIOError:
+            # Another process is saving; keep the pending counts for the next try
+            self._saved_at = time.monotonic()
+        except OSError as e:
+            print(f"DEBUG: Could not save selector stats: {e}")
+
+    def _maybe_save(self):
+        # Called on the event loop from every lookup, so it never waits for the lock
+        if time.monotonic() - self._saved_at >= SELECTOR_STATS_SAVE_SECONDS:
+            self.save(blocking=False)
+
+    # --- Ordering and Telemetry ---
+
+    def _slot(self, library: str, page_type: str) -> _SlotStats:
+        key = (library, page_type)
+        if key not in self._slots:
+            self._slots[key] = _SlotStats()
+        return self._slots[key]
+
+    def _pending_slot(self, library: str, page_type: str) -> _SlotStats:
+        key = (library, page_type)
+        if key not in self._pending:
+            self._pending[key] = _SlotStats()
+        return self._pending[key]
+
+    def ordered(self, library: str, page_type: str, candidates: List[str], generic: Iterable[str] = ()) -> List[str]:
+        """
+        Specific candidates with past winners first (most wins first; ties keep the
+        original order), then the ``generic`` ones in their original order.
+        """
+        wins = self._slot(library, page_type).wins
+        generic = set(generic)
+        specific = [selector for selector in candidates if selector not in generic]
+        fallbacks = [selector for selector in candidates if selector in generic]
+        return sorted(specific, key=lambda selector: -wins.get(selector, 0)) + fallbacks
+
+    def record_win(self, library: str, page_type: str, selector: str, candidates: List[str], count: int = 1):
+        depth = candidates.index(selector) if selector in candidates else len(candidates)
+        self._slot(library, page_type).add_win(selector, depth, count)
+        self._pending_slot(library, page_type).add_win(selector, depth, count)
+        self._maybe_save()
+
+    def record_miss(self, library: str, page_type: str):
+        self._slot(library, page_type).add_miss()
+        self._pending_slot(library, page_type).add_miss()
+        self._maybe_save()
+
+    # --- Lookup ---
+
+    async def find(
+        self,
+        page: Page,
+        library: str,
+        page_type: str,
+        candidates: List[str],
+        timeout_ms: int = 0,
+        generic: Iterable[str] = (),
+    ) -> Optional[Tuple[str, ElementHandle]]:
+        """
+        Find the element for the first matching candidate, learned order first
+        (``generic`` candidates always last, see ordered).
+
+        With ``timeout_ms`` the lookup first waits (once) for any candidate to
+        appear. Returns (selector, element) or None when nothing matched.
+        """
+        ordered = self.ordered(library, page_type, candidates, generic)
+        if timeout_ms > 0:
+            try:
+                await page.wait_for_selector(", ".join(ordered), timeout=timeout_ms)
+            except PlaywrightTimeoutError:
+                self.record_miss(library, page_type)
+                return None
+
+        for selector in ordered:
+            try:
+                element = await page.query_selector(selector)
+            except Exception:
+                continue  # Selector syntax the engine doesn't support here
+            if element:
+                self.record_win(library, page_type, selector, candidates)
+                return selector, element
+
+        self.record_miss(library, page_type)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        result: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        for (library, page_type), slot in self._slots.items():
+            hits = slot.lookups - slot.misses
+            result[library][page_type] = {
+                "lookups": slot.lookups,
+                "misses": slot.misses,
+                "avg_fallback_depth": round(slot.depth_total / hits, 2) if hits else None,
+                "last_fallback_depth": slot.last_depth,
+                "max_fallback_depth": slot.max_depth,
+                "top_selector": max(slot.wins, key=slot.wins.get) if slot.wins else None,
+            }
+        return dict(result)
+
+
+# Shared engine used by library_service
+selector_engine = SelectorEngine()
@@ -0,0 +1,80 @@
+"""
+Encrypted cache of authenticated library sessions.
+
+Stores the Playwright ``storage_state`` (cookies + local storage) captured
+after a successful login, keyed by (library_name, card number), so repeated
+holds for the same card can skip the login flow until the session expires.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Optional, Dict, Any, Tuple
+from cryptography.fernet import Fernet, InvalidToken
+
+# --- Configuration ---
+SESSION_CACHE_TTL_SECONDS = int(os.getenv("SESSION_CACHE_TTL_SECONDS", "3600"))
+# Optional Fernet key; when unset a random per-process key is used, which is
+# fine because the cache lives in memory only
+SESSION_CACHE_KEY = os.getenv("SESSION_CACHE_KEY")
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class SessionCache:
+    """In-memory TTL cache of encrypted storage states."""
+
+    def __init__(self, ttl_seconds: int = SESSION_CACHE_TTL_SECONDS, key: Optional[str] = SESSION_CACHE_KEY):
+        self.ttl_seconds = ttl_seconds
+        self._fernet = Fernet(key.encode("utf-8") if key else Fernet.generate_key())
+        # cache key -> (expires_at, pin digest, encrypted storage state)
+        self._entries: Dict[str, Tuple[float, str, bytes]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, library_name: str, card_number: str) -> str:
+        # Card numbers are never stored in the clear
+        return _digest(library_name, card_number)
+
+    def get(self, library_name: str, card_number: str, pin: str) -> Optional[Dict[str, Any]]:
+        """Return the cached storage state, or None if missing, expired or for a different PIN."""
+        key = self._key(library_name, card_number)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, pin_digest, token = entry
+        if time.monotonic() >= expires_at or pin_digest != _digest(key, pin):
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        try:
+            state = json.loads(self._fernet.decrypt(token))
+        except (InvalidToken, ValueError):
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return state
+
+    def set(self, library_name: str, card_number: str, pin: str, storage_state: Dict[str, Any]):
+        """Encrypt and store a storage state captured after a successful login."""
+        key = self._key(library_name, card_number)
+        token = self._fernet.encrypt(json.dumps(storage_state).encode("utf-8"))
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, _digest(key, pin), token)
+
+    def invalidate(self, library_name: str, card_number: str):
+        """Forget the session for a card, e.g. after the library rejected its cookies."""
+        self._entries.pop(self._key(library_name, card_number), None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Shared cache used by library_service
+session_cache = SessionCache()
@@ -0,0 +1,40 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+Concurrent callers that ask for the same key share one running task and all
+receive its result (or its exception), so a burst of identical requests costs
+one scrape instead of one per request.
+"""
+import asyncio
+from typing import Dict, Any, Callable, Awaitable
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``fn`` for ``key`` unless a call for the same key is already running."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            self.started += 1
+
+            def _forget(finished: asyncio.Task, key: str = key):
+                if self._inflight.get(key) is finished:
+                    del self._inflight[key]
+
+            task.add_done_callback(_forget)
+        else:
+            self.coalesced += 1
+            print(f"DEBUG: Joining in-flight {self.name} for '{key}'")
+
+        # Shielded so one caller giving up doesn't cancel the work for the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._inflight), "started": self.started, "coalesced": self.coalesced}